@@ -31,7 +31,8 @@ def create_app(config_class=Config):
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
-    session_store.init_app(app)
+    from app.utils.sessions import init_sessions
+    init_sessions(app)
     csrf.init_app(app)
     migrate.init_app(app, db)
     
@@ -49,16 +50,29 @@ def create_app(config_class=Config):
         from app.models import User
         return User.query.get(int(user_id))
     
-    # Add b64encode filter to Jinja2
+    # Add b64encode filter to Jinja2 - only for tiny inline placeholders,
+    # real images must go through products.product_image so they are cached
     def b64encode(value):
         if value is None:
             return ''
         if isinstance(value, str):
             value = value.encode('utf-8')
+        if len(value) > app.config['B64_INLINE_MAX_BYTES']:
+            app.logger.warning(f'b64encode refused {len(value)} bytes, use an image URL instead')
+            return ''
         return base64.b64encode(value).decode('utf-8')
     
     app.jinja_env.filters['b64encode'] = b64encode
     
+    # Responsive product image helpers
+    from app.utils.image_variants import product_image_url, product_srcset
+    app.jinja_env.globals['product_image_url'] = product_image_url
+    app.jinja_env.globals['product_srcset'] = product_srcset
+    
+    # Rendered fragment cache for product cards
+    from app.utils.fragment_cache import cached_fragment
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
+    
     # Register blueprints
     from app.routes.main import bp as main_bp
     app.register_blueprint(main_bp)
@@ -91,8 +105,27 @@ def create_app(config_class=Config):
     from app.routes.admin import bp as admin_bp
     app.register_blueprint(admin_bp, url_prefix='/admin')
     
+    # Whole-page cache for anonymous catalog and static pages
+    from app.utils.page_cache import init_page_cache
+    init_page_cache(app)
+    
     # Create database tables if they don't exist (for Render deployment)
     with app.app_context():
         db.create_all()
     
+    # Optional in-process abandoned cart sweeper, otherwise run `flask sweep-carts` from cron
+    if app.config['CART_GC_INTERVAL'] > 0 and not app.config.get('TESTING'):
+        from app.utils.cart_gc import start_cart_gc_scheduler
+        start_cart_gc_scheduler(app)
+    
+    # Gives back stock of abandoned checkouts; with it off run `flask run-maintenance` from cron
+    if app.config['MAINTENANCE_INTERVAL'] > 0 and not app.config.get('TESTING'):
+        from app.utils.maintenance import start_maintenance_scheduler
+        start_maintenance_scheduler(app)
+    
+    # Applies queued Stripe webhook events, otherwise run `flask process-stripe-events` from cron
+    if app.config['STRIPE_WEBHOOK_SECRET'] and app.config['STRIPE_EVENT_POLL_INTERVAL'] > 0 and not app.config.get('TESTING'):
+        from app.utils.stripe_events import start_stripe_event_worker
+        start_stripe_event_worker(app)
+    
     return app
\ No newline at end of file
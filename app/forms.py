@@ -33,26 +33,33 @@ class LoginForm(FlaskForm):
     submit = SubmitField('Login')
 
 
+# Shared with the catalog filters in app/utils/catalog.py
+CATEGORY_CHOICES = [
+    ('Birthday', 'Birthday'), 
+    ('Wedding', 'Wedding'), 
+    ('Custom', 'Custom'),
+    ('Corporate', 'Corporate')
+]
+
+SIZE_CHOICES = [
+    ('6-inch', '6-inch'),
+    ('8-inch', '8-inch'),
+    ('10-inch', '10-inch'),
+    ('12-inch', '12-inch'),
+    ('2-Tier', '2-Tier'),
+    ('3-Tier', '3-Tier'),
+    ('4-Tier', '4-Tier')
+]
+
+
 class ProductForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired(), Length(max=150)])
     description = TextAreaField('Description', validators=[Optional(), Length(max=2000)])
-    category = SelectField('Category', choices=[
-        ('Birthday', 'Birthday'), 
-        ('Wedding', 'Wedding'), 
-        ('Custom', 'Custom'),
-        ('Corporate', 'Corporate')
-    ], default='Birthday')
-    size = SelectField('Size', choices=[
-        ('6-inch', '6-inch'),
-        ('8-inch', '8-inch'),
-        ('10-inch', '10-inch'),
-        ('12-inch', '12-inch'),
-        ('2-Tier', '2-Tier'),
-        ('3-Tier', '3-Tier'),
-        ('4-Tier', '4-Tier')
-    ], default='6-inch')
+    category = SelectField('Category', choices=CATEGORY_CHOICES, default='Birthday')
+    size = SelectField('Size', choices=SIZE_CHOICES, default='6-inch')
     stock = IntegerField('Stock', validators=[DataRequired(), NumberRange(min=0)])
     price = DecimalField('Price', validators=[DataRequired(), NumberRange(min=0)], places=2)
+    flash_sale = BooleanField('Flash sale')
     image_file = FileField('Product Image', validators=[
         Optional(),
         FileAllowed(['jpg', 'jpeg', 'png'], 'Images only!')
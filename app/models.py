@@ -30,15 +30,35 @@ class User(UserMixin, db.Model):
         return f'<User {self.email}>'
 
 class Product(db.Model):
+    # Composite indexes backing the keyset-paginated catalog listing
+    # (app/utils/catalog.py) and the admin low-stock panel
+    __table_args__ = (
+        db.Index('ix_product_listing_price', 'available', 'price', 'id'),
+        db.Index('ix_product_listing_name', 'available', 'name', 'id'),
+        db.Index('ix_product_listing_category_price', 'available', 'category', 'price', 'id'),
+        db.Index('ix_product_listing_size_price', 'available', 'size', 'price', 'id'),
+        db.Index('ix_product_available_stock', 'available', 'stock'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
-    description = db.Column(db.Text, default='')
+    # Large columns are only loaded on access (or with undefer_group('detail')),
+    # listing pages use the read models in app/utils/catalog.py instead
+    description = db.deferred(db.Column(db.Text, default=''), group='detail')
     category = db.Column(db.String(100), default='Birthday')
     size = db.Column(db.String(50), default='6-inch')
     stock = db.Column(db.Integer, default=0)
     price = db.Column(db.Float, nullable=False)
-    image_bytes = db.Column(db.LargeBinary, nullable=True)
+    # Image blobs live in the image store (app/utils/image_store.py),
+    # the row only keeps the content digest and metadata
+    image_digest = db.Column(db.String(64), nullable=True, index=True)
+    image_size = db.Column(db.Integer, nullable=True)
+    image_mime = db.Column(db.String(50), nullable=True)
+    image_variants = db.deferred(db.Column(db.JSON(none_as_null=True), nullable=True), group='detail')  # see image_variants.py
     available = db.Column(db.Boolean, default=True)
+    # Flash-sale products are claimed at checkout with a conditional
+    # decrement instead of row locks and holds (app/utils/stock.py)
+    flash_sale = db.Column(db.Boolean, default=False, nullable=False)
     
     # Relationships
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
@@ -46,6 +66,12 @@ class Product(db.Model):
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
 
 class CartItem(db.Model):
+    # One row per product per cart, cart writes are upserts against it
+    # (app/utils/cart_helper.py)
+    __table_args__ = (
+        db.Index('uq_cart_item_session_product', 'session_id', 'product_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(255), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -53,6 +79,8 @@ class CartItem(db.Model):
     unit_price = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Last write to the line, abandoned carts are swept by age (app/utils/cart_gc.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class Cart:
     def __init__(self, session_id=None):
@@ -67,88 +95,18 @@ class Cart:
             session['cart_id'] = self.session_id
         self.load_from_db()
     
-    def add_item(self, product, quantity=1):
-        existing_item = next((item for item in self.items if item.product_id == product.id), None)
-        if existing_item:
-            existing_item.quantity += quantity
-        else:
-            cart_item = CartItem(
-                session_id=self.session_id,
-                product_id=product.id,
-                product_name=product.name,
-                unit_price=product.price,
-                quantity=quantity
-            )
-            self.items.append(cart_item)
-    
-    def update_item(self, product_id, quantity):
-        item = next((item for item in self.items if item.product_id == product_id), None)
-        if item:
-            if quantity > 0:
-                item.quantity = quantity
-                db_item = CartItem.query.filter_by(
-                    session_id=self.session_id,
-                    product_id=product_id
-                ).first()
-                if db_item:
-                    db_item.quantity = quantity
-                    db.session.commit()
-            else:
-                self.remove_item(product_id)
-            return True
-        return False
-    
-    def remove_item(self, product_id):
-        self.items = [item for item in self.items if item.product_id != product_id]
-        CartItem.query.filter_by(
-            session_id=self.session_id,
-            product_id=product_id
-        ).delete()
-        db.session.commit()
-    
-    def clear(self):
-        self.items = []
-        CartItem.query.filter_by(session_id=self.session_id).delete()
-        db.session.commit()
-    
     @property
     def total(self):
-        return sum(float(item.unit_price) * item.quantity for item in self.items)
-    
-    def save_to_db(self):
-        try:
-            existing_items = CartItem.query.filter_by(session_id=self.session_id).all()
-            existing_dict = {item.product_id: item for item in existing_items}
-            
-            for item in self.items:
-                if item.product_id in existing_dict:
-                    db_item = existing_dict[item.product_id]
-                    db_item.quantity = item.quantity
-                    db_item.unit_price = item.unit_price
-                    db_item.product_name = item.product_name
-                else:
-                    new_item = CartItem(
-                        session_id=item.session_id,
-                        product_id=item.product_id,
-                        product_name=item.product_name,
-                        unit_price=item.unit_price,
-                        quantity=item.quantity
-                    )
-                    db.session.add(new_item)
-            
-            current_product_ids = {item.product_id for item in self.items}
-            for db_item in existing_items:
-                if db_item.product_id not in current_product_ids:
-                    db.session.delete(db_item)
-            
-            db.session.commit()
-            
-        except Exception as e:
-            db.session.rollback()
-            raise e
+        from app.utils.pricing import cart_totals
+        return cart_totals(self).subtotal
     
     def load_from_db(self):
-        self.items = CartItem.query.filter_by(session_id=self.session_id).all()
+        # One query for the items and the product columns the cart and
+        # checkout templates read (thumbnails need image_variants)
+        from sqlalchemy.orm import joinedload
+        self.items = CartItem.query.options(
+            joinedload(CartItem.product).undefer(Product.image_variants)
+        ).filter_by(session_id=self.session_id).order_by(CartItem.id).all()
     
     def __len__(self):
         return sum(item.quantity for item in self.items)
@@ -176,9 +134,14 @@ class Order(db.Model):
     stripe_session_id = db.Column(db.String(200), nullable=True)
     delivery_address = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # True once the items were taken off Product.stock (on payment); until
+    # then the order only holds StockReservation rows
+    stock_deducted = db.Column(db.Boolean, default=False, nullable=False)
     
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     feedbacks = db.relationship('Feedback', backref='order', lazy=True)
+    reservations = db.relationship('StockReservation', backref='order', lazy=True, cascade='all, delete-orphan')
+    checkout_outbox = db.relationship('CheckoutOutbox', backref='order', lazy=True, uselist=False, cascade='all, delete-orphan')
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -187,6 +150,59 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     unit_price = db.Column(db.Float, nullable=False)
 
+class StockReservation(db.Model):
+    # Stock held for an unpaid order until expires_at (app/utils/stock.py);
+    # available stock is Product.stock minus the unexpired unclaimed holds
+    __table_args__ = (
+        db.Index('ix_stock_reservation_product_active', 'product_id', 'claimed', 'expires_at', 'quantity'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    # Flash-sale claim: already taken off Product.stock, given back if it expires
+    claimed = db.Column(db.Boolean, default=False, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class CheckoutOutbox(db.Model):
+    # Stripe Checkout session to create for an order, written in the same
+    # transaction as the order (app/utils/checkout_outbox.py)
+    __tablename__ = 'checkout_outbox'
+    __table_args__ = (
+        db.Index('ix_checkout_outbox_status_created', 'status', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, unique=True)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, cancelling, sent, failed, abandoned
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)  # relay backoff after a Stripe error
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+class IdempotencyKey(db.Model):
+    # One row per "Place order" form submission, so a repeated post of the
+    # same form replays the first result (app/utils/idempotency.py)
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (
+        db.Index('uq_idempotency_key_user_key', 'user_id', 'key', unique=True),
+        db.Index('ix_idempotency_key_status_claimed', 'status', 'claimed_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='processing')  # processing, completed
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='SET NULL'), nullable=True)
+    redirect_url = db.Column(db.String(1000), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)  # when the request processing it started
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -207,4 +223,35 @@ class Payment(db.Model):
     stripe_payment_intent_id = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     paid_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(50), default='Succeeded')
\ No newline at end of file
+    status = db.Column(db.String(50), default='Succeeded')
+
+class StripeEvent(db.Model):
+    # Append-only log of verified Stripe webhook events, applied to orders
+    # in batches by app/utils/stripe_events.py; event_id dedupes replays
+    __tablename__ = 'stripe_event'
+    __table_args__ = (
+        db.Index('ix_stripe_event_pending', 'processed_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255), nullable=False, unique=True)
+    type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+
+class ServerSession(db.Model):
+    # Server-side session store for SESSION_BACKEND = 'sqlalchemy' (app/utils/sessions.py)
+    __tablename__ = 'server_session'
+    
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expiry = db.Column(db.DateTime, nullable=False, index=True)
+
+class CacheVersion(db.Model):
+    """Shared version stamps used to invalidate per-process caches"""
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
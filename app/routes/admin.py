@@ -3,8 +3,11 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from sqlalchemy import func
 from datetime import datetime, timedelta
+import os
 from app import db
 from app.models import User, Order, Product, CartItem, Favorite, Feedback
+from app.utils import catalog
+from app.utils.stock import release_order_stock
 
 bp = Blueprint('admin', __name__)
 
@@ -33,7 +36,7 @@ def dashboard():
         recent_orders = Order.query.order_by(Order.order_date.desc()).limit(10).all()
         
         # Get low stock products (less than 5 items)
-        low_stock_products = Product.query.filter(Product.stock < 5, Product.available == True).all()
+        low_stock_products = catalog.low_stock_products(threshold=5)
         
         # Get current date for the template
         current_date = datetime.utcnow()
@@ -251,6 +254,8 @@ def update_order_status(order_id):
         new_status = request.form.get('status')
         
         if new_status in ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled']:
+            if new_status == 'Cancelled' and order.status != 'Cancelled':
+                release_order_stock(order)
             order.status = new_status
             db.session.commit()
             flash(f'Order #{order.id} status updated to {new_status}.', 'success')
@@ -262,6 +267,25 @@ def update_order_status(order_id):
         flash(f'Error updating order status: {str(e)}', 'error')
         return redirect(url_for('admin.order_detail', order_id=order_id))
 
+@bp.route('/cache-stats')
+def cache_stats():
+    """Hit/miss counters for this worker's catalog, fragment and page caches"""
+    from app.utils.catalog_cache import catalog_cache
+    from app.utils.fragment_cache import fragment_cache
+    from app.utils.page_cache import page_cache
+    return jsonify({
+        'pid': os.getpid(),
+        'catalog': catalog_cache.stats(),
+        'fragments': fragment_cache.stats(),
+        'pages': page_cache.stats()
+    })
+
+@bp.route('/cart-gc-stats')
+def cart_gc_stats():
+    """Abandoned cart sweeps run by this worker"""
+    from app.utils.cart_gc import gc_stats
+    return jsonify({'pid': os.getpid(), 'cart_gc': gc_stats.as_dict()})
+
 @bp.route('/debug-users')
 def debug_users():
     """Debug route to check users in database"""
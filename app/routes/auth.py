@@ -5,6 +5,7 @@ from datetime import datetime
 from app import db
 from app.models import User
 from app.forms import LoginForm, RegistrationForm
+from app.utils.sessions import regenerate_session
 
 bp = Blueprint('auth', __name__)
 
@@ -58,6 +59,7 @@ def login():
         
         if user and check_password_hash(user.password_hash, form.password.data):
             user.last_login = datetime.utcnow()
+            regenerate_session()
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('main.index'))
@@ -1,60 +1,53 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, jsonify, abort
 from flask_login import login_required, current_user
 from app import db
-from app.models import Product, CartItem, Coupon
-from app.utils.cart_helper import get_cart, save_cart, clear_cart
+from app.models import Coupon
+from app.utils.cart_helper import get_cart, clear_cart, cart_count, add_to_cart, set_cart_quantity, set_cart_quantities, remove_from_cart
+from app.utils.catalog import product_detail
+from app.utils.catalog_cache import catalog_cache
+from app.utils.pricing import cart_totals, line_total_cents, from_cents
+from app.utils.stock import available_stock
 from datetime import datetime
 
 bp = Blueprint('cart', __name__)
 
+# Most line changes accepted by one /cart/update-batch request
+MAX_BATCH_CHANGES = 50
+
 
 @bp.route('/')
 @login_required
 def index():
     cart = get_cart()
-    
-    # Get coupon from session
-    coupon_code = session.get('coupon_code')
-    coupon_value = session.get('coupon_value', 0)
-    coupon_is_percentage = session.get('coupon_is_percentage', False)
-    
-    # Calculate discount
-    discount = 0
-    if coupon_code:
-        if coupon_is_percentage:
-            discount = float(cart.total) * (float(coupon_value) / 100)
-        else:
-            discount = float(coupon_value)
-        
-        # Never allow negative total
-        if discount > float(cart.total):
-            discount = float(cart.total)
-    
-    grand_total = max(0, float(cart.total) - discount)  # Ensure non-negative
+    totals = cart_totals(cart)
     
     return render_template('cart/index.html', 
                          cart=cart, 
-                         coupon_code=coupon_code,
-                         discount=discount,
-                         grand_total=grand_total)
+                         coupon_code=session.get('coupon_code'),
+                         discount=totals.discount,
+                         grand_total=totals.grand_total)
 
 
 @bp.route('/add/<int:product_id>', methods=['POST'])
 def add(product_id):
-    product = Product.query.get_or_404(product_id)
+    # Same cached read model as the details page; the stock left after
+    # other orders' holds is read live. Stock is re-checked under lock
+    # at checkout.
+    product = catalog_cache.get(f'product:{product_id}', lambda: product_detail(product_id))
+    if product is None:
+        abort(404)
     quantity = request.form.get('quantity', 1, type=int)
+    stock = available_stock([product_id]).get(product_id, 0)
     
-    if not product.available or product.stock < 1 or quantity < 1:
+    if not product.available or stock < 1 or quantity < 1:
         flash('Product not available or invalid quantity.', 'error')
         return redirect(url_for('products.index'))
     
-    if quantity > product.stock:
-        flash(f'Only {product.stock} items available in stock.', 'error')
+    if quantity > stock:
+        flash(f'Only {stock} items available in stock.', 'error')
         return redirect(url_for('products.index'))
     
-    cart = get_cart()
-    cart.add_item(product, quantity)
-    save_cart(cart)
+    add_to_cart(product, quantity)
     
     flash(f'{product.name} added to cart!', 'success')
     return redirect(url_for('cart.index'))
@@ -62,9 +55,7 @@ def add(product_id):
 
 @bp.route('/remove/<int:product_id>', methods=['POST'])
 def remove(product_id):
-    cart = get_cart()
-    cart.remove_item(product_id)
-    save_cart(cart)
+    remove_from_cart(product_id)
     
     flash('Item removed from cart.', 'success')
     return redirect(url_for('cart.index'))
@@ -73,62 +64,92 @@ def remove(product_id):
 @bp.route('/update/<int:product_id>', methods=['POST'])
 def update_item_ajax(product_id):
     """AJAX endpoint for updating cart items"""
-    product = Product.query.get_or_404(product_id)
+    product = catalog_cache.get(f'product:{product_id}', lambda: product_detail(product_id))
+    if product is None:
+        abort(404)
     quantity = request.form.get('quantity', 1, type=int)
     
     if quantity < 1:
         return jsonify({'error': 'Quantity must be at least 1'}), 400
     
-    if quantity > product.stock:
-        return jsonify({'error': f'Only {product.stock} items available in stock'}), 400
+    stock = available_stock([product_id]).get(product_id, 0)
+    if quantity > stock:
+        return jsonify({'error': f'Only {stock} items available in stock'}), 400
     
-    cart = get_cart()
+    try:
+        if not set_cart_quantity(product_id, quantity):
+            return jsonify({'error': 'Item not found in cart'}), 404
+        
+        cart = get_cart()
+        cart_item = next(item for item in cart.items if item.product_id == product_id)
+        return jsonify({
+            'success': True,
+            'item_subtotal': float(from_cents(line_total_cents(cart_item))),
+            **cart_totals(cart).as_json()
+        })
+    except Exception:
+        db.session.rollback()
+        return jsonify({'error': 'Error updating cart'}), 500
+
+
+@bp.route('/update-batch', methods=['POST'])
+def update_batch():
+    """Apply several quantity changes at once: {"items": [{"product_id", "quantity"}]}
+
+    Everything is validated first (stock minus active holds for all
+    products in one pass)
+    and nothing is written unless every change is valid. Quantity 0
+    removes the line.
+    """
+    payload = request.get_json(silent=True) or {}
+    changes = payload.get('items')
+    if not isinstance(changes, list) or not changes:
+        return jsonify({'error': 'Expected a non-empty "items" list'}), 400
+    if len(changes) > MAX_BATCH_CHANGES:
+        return jsonify({'error': f'At most {MAX_BATCH_CHANGES} changes per request'}), 400
+    
+    quantities = {}
+    for change in changes:
+        try:
+            product_id = int(change['product_id'])
+            quantity = int(change['quantity'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Each item needs an integer product_id and quantity'}), 400
+        if quantity < 0:
+            return jsonify({'error': 'Quantity cannot be negative', 'product_id': product_id}), 400
+        quantities[product_id] = quantity  # last change to a line wins
     
-    # Update the cart item
-    cart_item = CartItem.query.filter_by(
-        session_id=cart.session_id,
-        product_id=product_id
-    ).first()
+    cart = get_cart()
+    in_cart = {item.product_id for item in cart.items}
+    stock = available_stock(list(quantities))
+    
+    errors = []
+    for product_id, quantity in quantities.items():
+        if product_id not in in_cart:
+            errors.append({'product_id': product_id, 'error': 'Item not found in cart'})
+        elif quantity > stock.get(product_id, 0):
+            errors.append({'product_id': product_id,
+                           'error': f'Only {stock.get(product_id, 0)} items available in stock'})
+    if errors:
+        return jsonify({'error': errors[0]['error'], 'errors': errors}), 400
+    
+    try:
+        set_cart_quantities(quantities)
+    except Exception:
+        db.session.rollback()
+        return jsonify({'error': 'Error updating cart'}), 500
     
-    if cart_item:
-        cart_item.quantity = quantity
-        try:
-            db.session.commit()
-            
-            # Calculate new totals
-            coupon_code = session.get('coupon_code')
-            coupon_value = session.get('coupon_value', 0)
-            coupon_is_percentage = session.get('coupon_is_percentage', False)
-            
-            discount = 0
-            if coupon_code:
-                if coupon_is_percentage:
-                    discount = float(cart.total) * (float(coupon_value) / 100)
-                else:
-                    discount = float(coupon_value)
-                
-                if discount > float(cart.total):
-                    discount = float(cart.total)
-            
-            grand_total = max(0, float(cart.total) - discount)
-            
-            # Get updated item subtotal
-            item_subtotal = float(cart_item.unit_price) * cart_item.quantity
-            
-            return jsonify({
-                'success': True,
-                'item_subtotal': round(item_subtotal, 2),
-                'cart_total': round(float(cart.total), 2),
-                'discount': round(discount, 2),
-                'grand_total': round(grand_total, 2),
-                'item_count': len(cart)
-            })
-            
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': 'Error updating cart'}), 500
-    
-    return jsonify({'error': 'Item not found in cart'}), 404
+    cart = get_cart()
+    return jsonify({
+        'success': True,
+        'items': [{
+            'product_id': item.product_id,
+            'quantity': item.quantity,
+            'item_subtotal': float(from_cents(line_total_cents(item)))
+        } for item in cart.items if item.product_id in quantities],
+        'removed': [product_id for product_id, quantity in quantities.items() if quantity == 0],
+        **cart_totals(cart).as_json()
+    })
 
 
 @bp.route('/apply-coupon', methods=['POST'])
@@ -170,36 +191,17 @@ def remove_coupon():
 
 @bp.route('/get-count')
 def get_count():
-    cart = get_cart()
-    return jsonify({'count': len(cart)})
+    """Cart badge count from the session, 304 when it hasn't changed"""
+    count = cart_count()
+    response = jsonify({'count': count})
+    response.set_etag(f'cart-count-{count}')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @bp.route('/get-totals', methods=['GET'])
 def get_totals():
     """Get current cart totals for AJAX refresh"""
     cart = get_cart()
-    
-    # Get coupon info
-    coupon_code = session.get('coupon_code')
-    coupon_value = session.get('coupon_value', 0)
-    coupon_is_percentage = session.get('coupon_is_percentage', False)
-    
-    # Calculate discount
-    discount = 0
-    if coupon_code:
-        if coupon_is_percentage:
-            discount = float(cart.total) * (float(coupon_value) / 100)
-        else:
-            discount = float(coupon_value)
-        
-        if discount > float(cart.total):
-            discount = float(cart.total)
-    
-    grand_total = max(0, float(cart.total) - discount)
-    
-    return jsonify({
-        'cart_total': round(float(cart.total), 2),
-        'discount': round(discount, 2),
-        'grand_total': round(grand_total, 2),
-        'item_count': len(cart)
-    })
\ No newline at end of file
+    return jsonify(cart_totals(cart).as_json())
\ No newline at end of file
@@ -1,9 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, jsonify
 from flask_login import login_required, current_user
-from app import db
-from app.models import Order, OrderItem, Product
+from app import db, csrf
+from app.models import Order, OrderItem
 from app.utils.cart_helper import get_cart, clear_cart
-from app.utils.stripe_service import create_checkout_session
+from app.utils.checkout_outbox import enqueue_checkout_session, send_checkout_session
+from app.utils.idempotency import (new_idempotency_key, claim_idempotency_key, idempotency_result, is_orphaned,
+                                   link_idempotency_key, complete_idempotency_key, release_idempotency_key)
+from app.utils.pricing import cart_totals
+from app.utils.stock import lock_products, held_quantities, check_stock, claim_stock, reserve_stock, hold_expiry
+from app.utils.stripe_events import record_stripe_event, wake_event_worker, sync_checkout_session
+from sqlalchemy import insert
 import stripe
 
 bp = Blueprint('checkout', __name__)
@@ -16,28 +22,14 @@ def index():
         flash('Your cart is empty.', 'info')
         return redirect(url_for('cart.index'))
     
-    # Calculate discount
-    coupon_code = session.get('coupon_code')
-    coupon_value = session.get('coupon_value', 0)
-    coupon_is_percentage = session.get('coupon_is_percentage', False)
-    
-    discount = 0
-    if coupon_code:
-        if coupon_is_percentage:
-            discount = float(cart.total) * (float(coupon_value) / 100)
-        else:
-            discount = float(coupon_value)
-        
-        if discount > float(cart.total):
-            discount = float(cart.total)
-    
-    grand_total = float(cart.total) - discount
+    totals = cart_totals(cart)
     
     return render_template('checkout/index.html', 
                          cart=cart, 
-                         coupon_code=coupon_code,
-                         discount=discount,
-                         grand_total=grand_total)
+                         coupon_code=session.get('coupon_code'),
+                         discount=totals.discount,
+                         grand_total=totals.grand_total,
+                         idempotency_key=new_idempotency_key())
 
 @bp.route('/create-order', methods=['POST'])
 @login_required
@@ -47,99 +39,138 @@ def create_order():
         flash('Please provide a delivery address.', 'error')
         return redirect(url_for('checkout.index'))
     
+    # A double-clicked or resubmitted form carries the same key: answer it
+    # at once with the first post's Stripe session, or a page that polls
+    # for it while the first post is still running
+    key = request.form.get('idempotency_key', '').strip()[:64] or new_idempotency_key()
+    existing = claim_idempotency_key(current_user.id, key)
+    if existing is not None:
+        if existing.status == 'completed':
+            return redirect(_completed_url(existing.redirect_url, existing.order_id))
+        return redirect(url_for('checkout.placing', key=key))
+    
     cart = get_cart()
     if not cart.items:
+        release_idempotency_key(current_user.id, key)
         flash('Your cart is empty.', 'error')
         return redirect(url_for('cart.index'))
     
-    # Stock check with row locking to prevent race conditions
+    # Phase 1, a few milliseconds: every line is locked in one sorted
+    # SELECT ... FOR UPDATE, so checkouts sharing products queue in the
+    # same order. Flash-sale lines are then claimed with one conditional
+    # decrement, the rest measured against what other unpaid orders are
+    # holding. The order and its holds commit before Stripe is called,
+    # so no product row stays locked for the HTTP round-trip.
     try:
-        for item in cart.items:
-            # Use with_for_update to lock the row
-            product = Product.query.with_for_update().get(item.product_id)
-            if not product:
-                flash('One or more products are no longer available.', 'error')
-                return redirect(url_for('checkout.index'))
-            
-            if product.stock < item.quantity:
-                flash(f'Sorry, {product.name} is no longer available in the requested quantity. Only {product.stock} left.', 'error')
-                return redirect(url_for('checkout.index'))
-        
-        # Calculate discount
-        coupon_code = session.get('coupon_code')
-        coupon_value = session.get('coupon_value', 0)
-        coupon_is_percentage = session.get('coupon_is_percentage', False)
+        quantities = {item.product_id: item.quantity for item in cart.items}
+        flash_sale = {item.product_id: item.quantity for item in cart.items if item.product.flash_sale}
+        regular = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in flash_sale}
         
-        discount = 0
-        if coupon_code:
-            if coupon_is_percentage:
-                discount = float(cart.total) * (float(coupon_value) / 100)
+        locked = lock_products(quantities)
+        problems = claim_stock(flash_sale)
+        if not problems:
+            problems = check_stock(locked, regular, held_quantities(list(regular)))
+        if problems:
+            release_idempotency_key(current_user.id, key)  # rolls back the locks and any partial claim
+            problem = problems[0]
+            if problem.name is None:
+                flash('One or more products are no longer available.', 'error')
             else:
-                discount = float(coupon_value)
-            
-            if discount > float(cart.total):
-                discount = float(cart.total)
+                flash(f'Sorry, {problem.name} is no longer available in the requested quantity. Only {problem.available} left.', 'error')
+            return redirect(url_for('checkout.index'))
         
-        grand_total = float(cart.total) - discount
+        grand_total = cart_totals(cart).grand_total
         
         # Create order
         order = Order(
             user_id=current_user.id,
             delivery_address=delivery_address,
-            total_amount=grand_total,
+            total_amount=float(grand_total),
             status='Pending',
             payment_status='Pending'
         )
         db.session.add(order)
         db.session.flush()  # Get the order ID without committing
         
-        # Create order items and update stock
-        for item in cart.items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                unit_price=float(item.unit_price)
-            )
-            db.session.add(order_item)
-            
-            # Update stock
-            product = Product.query.get(item.product_id)
-            product.stock -= item.quantity
+        # Create order items in one bulk statement and hold their stock;
+        # regular stock is only decremented once the order is paid
+        db.session.execute(insert(OrderItem), [{
+            'order_id': order.id,
+            'product_id': item.product_id,
+            'quantity': item.quantity,
+            'unit_price': float(item.unit_price)
+        } for item in cart.items])
+        expires_at = hold_expiry()
+        reserve_stock(order.id, regular, expires_at)
+        reserve_stock(order.id, flash_sale, expires_at, claimed=True)
         
-        # Create Stripe session with proper parameters
-        stripe_session = create_checkout_session(
-            order_id=order.id,
+        # The Stripe call goes through the outbox, committed with the order
+        entry = enqueue_checkout_session(
+            order,
             amount=grand_total,
             customer_email=current_user.email,
             success_url=url_for('checkout.success', order_id=order.id, _external=True),
             cancel_url=url_for('checkout.cancel', _external=True)
         )
-        
-        order.stripe_session_id = stripe_session.id
+        link_idempotency_key(current_user.id, key, order.id)
         db.session.commit()
-        
-        # Clear cart
-        clear_cart()
-        
-        # Clear coupon from session
-        session.pop('coupon_code', None)
-        session.pop('coupon_value', None)
-        session.pop('coupon_is_percentage', None)
-        
-        # Redirect to Stripe Checkout
-        return redirect(stripe_session.url)
-        
+    except Exception as e:
+        current_app.logger.error(f'Order creation failed: {str(e)}')
+        release_idempotency_key(current_user.id, key)
+        flash('An error occurred while creating your order. Please try again.', 'error')
+        return redirect(url_for('checkout.index'))
+    
+    # Phase 2: send the outbox entry to Stripe, outside any transaction.
+    # Transient errors are retried with the same idempotency key; if it
+    # still fails the order is cancelled and its holds and claims given
+    # back, by the outbox relay once it has closed any session Stripe made.
+    try:
+        stripe_session = send_checkout_session(entry)
     except stripe.error.StripeError as e:
         current_app.logger.error(f'Stripe error: {str(e)}')
-        db.session.rollback()
+        release_idempotency_key(current_user.id, key)
         flash('Payment service error. Please try again.', 'error')
         return redirect(url_for('checkout.index'))
     except Exception as e:
-        current_app.logger.error(f'Order creation failed: {str(e)}')
-        db.session.rollback()
+        current_app.logger.error(f'Checkout session creation failed: {str(e)}')
+        release_idempotency_key(current_user.id, key)
         flash('An error occurred while creating your order. Please try again.', 'error')
         return redirect(url_for('checkout.index'))
+    
+    complete_idempotency_key(current_user.id, key, stripe_session.url)
+    
+    # Clear cart
+    clear_cart()
+    
+    # Clear coupon from session
+    session.pop('coupon_code', None)
+    session.pop('coupon_value', None)
+    session.pop('coupon_is_percentage', None)
+    
+    # Redirect to Stripe Checkout
+    return redirect(stripe_session.url)
+
+def _completed_url(redirect_url, order_id):
+    # Keys completed by the outbox relay have no Stripe URL, only the paid order
+    if redirect_url:
+        return redirect_url
+    return url_for('orders.details', id=order_id) if order_id else url_for('orders.index')
+
+@bp.route('/placing/<key>')
+@login_required
+def placing(key):
+    """Where a duplicate place-order post waits for the first one"""
+    result = idempotency_result(current_user.id, key)
+    if result is not None and is_orphaned(result.status, result.order_id, result.claimed_at):
+        # The first post died before committing an order
+        release_idempotency_key(current_user.id, key)
+        result = None
+    if result is None:
+        flash('Your order could not be placed. Please try again.', 'error')
+        return redirect(url_for('checkout.index'))
+    if result.status == 'completed':
+        return redirect(_completed_url(result.redirect_url, result.order_id))
+    return render_template('checkout/placing.html')
 
 @bp.route('/success')
 @login_required
@@ -154,15 +185,37 @@ def success():
         user_id=current_user.id
     ).first_or_404()
     
-    # Update order status only if still pending
-    if order.payment_status == 'Pending':
-        order.payment_status = 'Paid'
-        order.status = 'Baking'
-        db.session.commit()
+    # Payment is recorded from Stripe's webhook, landing here proves nothing.
+    # Without a webhook secret, ask Stripe about the session instead.
+    if order.payment_status == 'Pending' and not current_app.config['STRIPE_WEBHOOK_SECRET']:
+        try:
+            sync_checkout_session(order)
+        except stripe.error.StripeError as e:
+            current_app.logger.error(f'Stripe error: {str(e)}')
+            db.session.rollback()
     
     return render_template('checkout/success.html', order=order)
 
 @bp.route('/cancel')
 @login_required
 def cancel():
-    return render_template('checkout/cancel.html')
\ No newline at end of file
+    return render_template('checkout/cancel.html')
+
+@bp.route('/webhook', methods=['POST'])
+@csrf.exempt
+def webhook():
+    """Stripe webhook: verify, queue the raw event and answer straight away"""
+    secret = current_app.config['STRIPE_WEBHOOK_SECRET']
+    if not secret:
+        return jsonify({'error': 'Webhooks are not configured'}), 404
+    
+    payload = request.get_data()
+    try:
+        event = stripe.Webhook.construct_event(payload, request.headers.get('Stripe-Signature', ''), secret)
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return jsonify({'error': 'Invalid payload or signature'}), 400
+    
+    # Replays of an event id are dropped by the unique index
+    if record_stripe_event(event['id'], event['type'], payload.decode('utf-8')):
+        wake_event_worker()
+    return jsonify({'received': True})
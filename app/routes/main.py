@@ -1,28 +1,29 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
-from sqlalchemy import func
+from flask_wtf.csrf import generate_csrf
 from app import db
-from app.models import Product, Cart
+from app.models import Cart
 from app.utils.cart_helper import get_cart
+from app.utils.featured import featured_products
 import os
 
 bp = Blueprint('main', __name__)
 
 @bp.route('/')
 def index():
-    # Get featured products - fix decimal conversion
-    featured_products = Product.query.filter_by(available=True).order_by(func.random()).limit(3).all()
-    
-    # Convert prices to float to avoid SQLite decimal warnings
-    for product in featured_products:
-        product.price = float(product.price)
-    
     cart = get_cart() if current_user.is_authenticated else None
     
     return render_template('main/index.html',
-                         featured_products=featured_products,
+                         featured_products=featured_products(),
                          cart=cart)
 
+@bp.route('/csrf-token')
+def csrf_token():
+    """CSRF token for a page the page cache served without one"""
+    response = jsonify({'csrf_token': generate_csrf()})
+    response.cache_control.no_store = True
+    return response
+
 @bp.route('/about')
 def about():
     return render_template('main/about.html')
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import Order, OrderItem, Product
 from app.forms import OrderForm  # Removed duplicate form definitions
+from app.utils.stock import confirm_order_stock, release_order_stock
 
 bp = Blueprint('orders', __name__)
 
@@ -39,11 +40,14 @@ def change_status(id):
     new_status = request.form.get('status')
     
     if new_status in ['Pending', 'Baking', 'Shipped', 'Delivered', 'Cancelled']:
+        if new_status == 'Cancelled' and order.status != 'Cancelled':
+            release_order_stock(order)
         order.status = new_status
         
         # If order is delivered, automatically mark as paid if not already
         if new_status == 'Delivered' and order.payment_status == 'Pending':
             order.payment_status = 'Paid'
+            confirm_order_stock(order)
         
         db.session.commit()
         flash(f'Order status updated to {new_status}.', 'success')
@@ -65,16 +69,12 @@ def cancel(id):
         flash('Order cannot be cancelled once shipped, delivered, or already cancelled.', 'error')
         return redirect(url_for('orders.details', id=id))
     
-    # Cancel order
+    # Release holds / restore stock before flipping the status; the
+    # stock_deducted flag keeps this from restoring twice
+    release_order_stock(order)
     order.status = 'Cancelled'
     order.payment_status = 'Refunded'
     
-    # Restore stock only if not already restored
-    if order.status != 'Cancelled':  # Prevent double restoration
-        for item in order.items:
-            if item.product:  # Check if product still exists
-                item.product.stock += item.quantity
-    
     db.session.commit()
     
     flash('Your order was cancelled successfully.', 'success')
@@ -97,11 +97,8 @@ def delete(id):
     
     if request.method == 'POST':
         try:
-            # Restore stock before deleting (only for pending orders)
-            if order.status == 'Pending':
-                for item in order.items:
-                    if item.product:
-                        item.product.stock += item.quantity
+            # Release holds / restore stock before deleting
+            release_order_stock(order)
             
             # Delete the order (cascade will delete order items)
             db.session.delete(order)
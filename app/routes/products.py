@@ -1,28 +1,108 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, abort, current_app, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.models import Product, CartItem
-from app.forms import ProductForm
+from app.forms import ProductForm, CATEGORY_CHOICES, SIZE_CHOICES
 from app.utils.cart_helper import get_cart
+from app.utils.catalog import product_page, product_detail, parse_filters, filter_args, SORT_OPTIONS
+from app.utils.catalog_cache import catalog_cache, invalidate_catalog
+from app.utils.search import search_products
+from app.utils.stock import available_stock
+from app.utils.typeahead import current_index, product_changed, SUGGEST_LIMIT, MAX_SUGGEST_LIMIT
+from app.utils.image_store import get_image_store, save_product_image, detect_mimetype
+from app.utils.image_variants import save_product_variants, variant_digest, image_version, product_image_url
+from sqlalchemy.orm import undefer_group
+from werkzeug.http import is_resource_modified
 import io
+import os
 
 bp = Blueprint('products', __name__)
 
+def _listing_page():
+    """Current listing page for the request's filters and cursor"""
+    filters = parse_filters(request.args)
+    cursor = request.args.get('cursor')
+    products, next_cursor = catalog_cache.get(
+        ('page', filters, cursor),
+        lambda: product_page(filters, cursor)
+    )
+    return filters, products, next_cursor
+
 @bp.route('/')
 def index():
     # Added try-except for better error handling
     try:
-        products = Product.query.filter(Product.stock > 0, Product.available == True).all()
+        filters, products, next_cursor = _listing_page()
         cart = get_cart()
-        return render_template('products/index.html', products=products, cart=cart)
+        return render_template('products/index.html',
+                             products=products,
+                             cart=cart,
+                             filters=filters,
+                             filter_args=filter_args(filters),
+                             next_cursor=next_cursor,
+                             is_first_page=not request.args.get('cursor'),
+                             category_choices=CATEGORY_CHOICES,
+                             size_choices=SIZE_CHOICES,
+                             sort_options=SORT_OPTIONS)
     except Exception as e:
         flash('Error loading products. Please try again.', 'error')
         return render_template('products/index.html', products=[], cart=None)
 
+@bp.route('/api/list')
+def list_json():
+    """JSON listing with the same filters and keyset cursor as the shop page"""
+    filters, products, next_cursor = _listing_page()
+    return jsonify({
+        'products': [{
+            'id': product.id,
+            'name': product.name,
+            'category': product.category,
+            'size': product.size,
+            'price': product.price,
+            'stock': product.stock,
+            'image_url': product_image_url(product, 'card') if product.image_digest else None,
+            'url': url_for('products.details', id=product.id)
+        } for product in products],
+        'next_cursor': next_cursor
+    })
+
+@bp.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    try:
+        products = catalog_cache.get(('search', query.lower()), lambda: search_products(query)) if query else []
+        cart = get_cart()
+        return render_template('products/index.html',
+                             products=products,
+                             cart=cart,
+                             search_query=query)
+    except Exception as e:
+        flash('Error searching products. Please try again.', 'error')
+        return render_template('products/index.html', products=[], cart=None, search_query=query)
+
+@bp.route('/suggest')
+def suggest():
+    """Search-as-you-type completions, served from the in-memory index"""
+    limit = max(1, min(request.args.get('limit', SUGGEST_LIMIT, type=int), MAX_SUGGEST_LIMIT))
+    categories, matches = current_index().suggest(request.args.get('q', ''), limit)
+    return jsonify({
+        'suggestions': [
+            {'type': 'category', 'label': category, 'url': url_for('products.index', category=category)}
+            for category in categories
+        ] + [
+            {'type': 'product', 'label': name, 'url': url_for('products.details', id=product_id)}
+            for product_id, name in matches
+        ]
+    })
+
 @bp.route('/<int:id>')
 def details(id):
     try:
-        product = Product.query.get_or_404(id)
+        product = catalog_cache.get(f'product:{id}', lambda: product_detail(id))
+        if product is None:
+            abort(404)
+        # Show what can still be bought, not what other orders are holding
+        product = product._replace(stock=available_stock([id]).get(id, 0))
         cart = get_cart()
         return render_template('products/details.html', product=product, cart=cart)
     except Exception as e:
@@ -47,6 +127,7 @@ def create():
                 size=form.size.data,
                 stock=form.stock.data,
                 price=form.price.data,
+                flash_sale=form.flash_sale.data,
                 available=True  # Added this field
             )
             
@@ -56,10 +137,13 @@ def create():
                 if len(image_data) > 4 * 1024 * 1024:  # 4MB limit
                     flash('Image file size must be less than 4MB.', 'error')
                     return render_template('products/create.html', form=form)
-                product.image_bytes = image_data
+                save_product_image(product, image_data)
+                save_product_variants(product, image_data)
             
             db.session.add(product)
+            invalidate_catalog()
             db.session.commit()
+            product_changed(product)
             
             flash('Product created successfully!', 'success')
             return redirect(url_for('products.index'))
@@ -77,7 +161,7 @@ def edit(id):
         flash('Admin access required.', 'error')
         return redirect(url_for('products.index'))
     
-    product = Product.query.get_or_404(id)
+    product = Product.query.options(undefer_group('detail')).get_or_404(id)
     form = ProductForm(obj=product)
     
     if form.validate_on_submit():
@@ -88,6 +172,7 @@ def edit(id):
             product.size = form.size.data
             product.stock = form.stock.data
             product.price = form.price.data
+            product.flash_sale = form.flash_sale.data
             
             # Check if new image is uploaded
             if form.image_file.data:
@@ -95,9 +180,12 @@ def edit(id):
                 if len(image_data) > 4 * 1024 * 1024:  # 4MB limit
                     flash('Image file size must be less than 4MB.', 'error')
                     return render_template('products/edit.html', form=form, product=product)
-                product.image_bytes = image_data
+                save_product_image(product, image_data)
+                save_product_variants(product, image_data)
             
+            invalidate_catalog()
             db.session.commit()
+            product_changed(product)
             flash('Product updated successfully!', 'success')
             return redirect(url_for('products.index'))
         except Exception as e:
@@ -118,7 +206,9 @@ def delete(id):
     try:
         product = Product.query.get_or_404(id)
         db.session.delete(product)
+        invalidate_catalog()
         db.session.commit()
+        product_changed(product_id=id)
         flash('Product deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -126,17 +216,101 @@ def delete(id):
     
     return redirect(url_for('products.index'))
 
+# Cache lifetimes for product images
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # URL carries ?v=<digest prefix>
+REVALIDATE_MAX_AGE = 0  # unversioned URL, browsers must revalidate (cheap 304)
+
+def _send_image(digest, mimetype, download_name, as_attachment, immutable=False):
+    """Send a stored image with ETag/Last-Modified validators.
+    
+    Conditional requests are answered from the digest alone, the blob is
+    only opened when the client actually needs the bytes.
+    """
+    store = get_image_store()
+    last_modified = store.modified_at(digest)
+    
+    if not is_resource_modified(request.environ, etag=digest, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+        response.set_etag(digest)
+        response.last_modified = last_modified
+    else:
+        path = store.path(digest)
+        if path and os.path.exists(path):
+            source = path
+        else:
+            data = store.get(digest)
+            if data is None:
+                return None
+            source = io.BytesIO(data)
+        
+        response = send_file(
+            source,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            etag=digest,
+            last_modified=last_modified,
+            max_age=IMMUTABLE_MAX_AGE if immutable else REVALIDATE_MAX_AGE,
+            conditional=False
+        )
+    
+    if as_attachment:
+        # Admin-only downloads must not be stored by shared caches
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    elif immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = REVALIDATE_MAX_AGE
+        response.cache_control.must_revalidate = True
+    return response
+
+def _send_product_image(product, as_attachment, variant=None, fmt=None, version=None):
+    """Send a product's original image or one of its resized variants"""
+    digest, mimetype = product.image_digest, product.image_mime
+    if variant:
+        variant_hash, variant_fmt = variant_digest(product, variant, fmt)
+        if variant_hash:
+            digest, mimetype = variant_hash, f'image/{variant_fmt}'
+    
+    if not mimetype:
+        # Rows migrated without metadata, sniff the stored bytes once
+        data = get_image_store().get(digest)
+        mimetype = detect_mimetype(data) if data else 'application/octet-stream'
+    
+    extension = mimetype.split('/')[-1].replace('jpeg', 'jpg')
+    download_name = f'{product.name.replace(" ", "_")}.{extension}'
+    immutable = version is not None and version == image_version(product)
+    return _send_image(digest, mimetype, download_name, as_attachment, immutable=immutable)
+
 @bp.route('/<int:id>/image')
 def product_image(id):
     try:
-        product = Product.query.get_or_404(id)
-        if product.image_bytes:
-            return send_file(
-                io.BytesIO(product.image_bytes),
-                mimetype='image/jpeg',
+        # Only the image metadata columns, never the whole product row
+        product = db.session.query(
+            Product.id,
+            Product.name,
+            Product.image_digest,
+            Product.image_mime,
+            Product.image_variants
+        ).filter(Product.id == id).first()
+        if product is None:
+            abort(404)
+        
+        if product.image_digest:
+            response = _send_product_image(
+                product,
                 as_attachment=False,
-                download_name=f'{product.name.replace(" ", "_")}.jpg'
+                variant=request.args.get('variant'),
+                fmt=request.args.get('format'),
+                version=request.args.get('v')
             )
+            if response is not None:
+                return response
         return redirect(url_for('static', filename='images/no-image.png'))
     except Exception as e:
         flash('Error loading image.', 'error')
@@ -151,13 +325,10 @@ def download_image(id):
     
     try:
         product = Product.query.get_or_404(id)
-        if product.image_bytes:
-            return send_file(
-                io.BytesIO(product.image_bytes),
-                mimetype='image/jpeg',
-                as_attachment=True,
-                download_name=f'{product.name.replace(" ", "_")}.jpg'
-            )
+        if product.image_digest:
+            response = _send_product_image(product, as_attachment=True)
+            if response is not None:
+                return response
         flash('No image available for download.', 'error')
         return redirect(url_for('products.edit', id=id))
     except Exception as e:
@@ -258,4 +258,42 @@ function showToast(message, type = 'info') {
     $('#toastContainer').append(toastHtml);
     var toast = new bootstrap.Toast($('#toastContainer .toast').last()[0]);
     toast.show();
-}
\ No newline at end of file
+}
+
+// Search-as-you-type suggestions for the shop search box
+$(document).ready(function() {
+    var input = $('#productSearch');
+    if (!input.length) {
+        return;
+    }
+    var list = $('#' + input.attr('list'));
+    var urls = {};
+    var timer = null;
+    
+    input.on('input', function() {
+        var value = input.val();
+        
+        // Picking a suggestion goes straight to it
+        if (urls[value]) {
+            window.location = urls[value];
+            return;
+        }
+        
+        clearTimeout(timer);
+        timer = setTimeout(function() {
+            if (value.trim().length < 2) {
+                list.empty();
+                return;
+            }
+            $.getJSON(input.data('suggest-url'), { q: value }, function(data) {
+                list.empty();
+                urls = {};
+                data.suggestions.forEach(function(suggestion) {
+                    var label = suggestion.type === 'category' ? suggestion.label + ' cakes' : suggestion.label;
+                    urls[label] = suggestion.url;
+                    list.append($('<option>').attr('value', label));
+                });
+            });
+        }, 120);
+    });
+});
@@ -1,29 +1,188 @@
-from flask import session
+from flask import session, g
+from sqlalchemy import case, delete, func, update
+from sqlalchemy.exc import IntegrityError
 from app.models import Cart, CartItem
 from datetime import datetime
 from app import db
+from app.utils.dialects import upsert_insert
 
 
-def get_cart():
-    """Get or create cart for current session"""
+def _cart_session_id():
     session_id = session.get('cart_id')
     if not session_id:
         session_id = str(datetime.utcnow().timestamp())
         session['cart_id'] = session_id
-    
-    cart = Cart(session_id=session_id)
+        session['cart_lines'] = 0
+        session['cart_count'] = 0
+    return session_id
+
+
+def get_cart():
+    """Get or create cart for current session, loaded once per request"""
+    session_id = _cart_session_id()
+    cart = g.get('cart')
+    if cart is None or cart.session_id != session_id:
+        cart = Cart(session_id=session_id)
+        g.cart = cart
+        if not cart.items and session.get('cart_count'):
+            # Swept by the stale-cart GC, drop the badge's stale count
+            session['cart_lines'] = 0
+            session['cart_count'] = 0
     return cart
 
 
-def save_cart(cart):
-    """Save cart to database"""
-    cart.save_to_db()
+def forget_cart():
+    """Drop the request's memoized cart so the next get_cart() reloads it"""
+    g.pop('cart', None)
+
+
+def _refresh_counts(lines_delta=None, count_delta=None):
+    """Keep the cart's line and item counts in the session.
+
+    The badge endpoint and the page cache read them instead of querying.
+    Adds apply a known delta; other writes recount with one aggregate.
+    """
+    if lines_delta is not None and 'cart_count' in session:
+        session['cart_lines'] = max(0, session.get('cart_lines', 0) + lines_delta)
+        session['cart_count'] = max(0, session['cart_count'] + count_delta)
+    else:
+        lines, count = db.session.query(
+            func.count(CartItem.id), func.coalesce(func.sum(CartItem.quantity), 0)
+        ).filter(CartItem.session_id == _cart_session_id()).one()
+        session['cart_lines'] = lines
+        session['cart_count'] = int(count)
+    forget_cart()
+
+
+def cart_count():
+    """Total quantity in the session's cart, without a query once known"""
+    if 'cart_count' not in session:
+        _refresh_counts()
+    return session['cart_count']
+
+
+def add_to_cart(product, quantity=1):
+    """Add quantity of a product in one INSERT ... ON CONFLICT DO UPDATE.
+
+    Concurrent adds from two tabs both land: the database sums them on
+    the unique (session_id, product_id) index instead of Python doing a
+    read-modify-write. Returns the line's new quantity.
+    """
+    values = {
+        'session_id': _cart_session_id(),
+        'product_id': product.id,
+        'product_name': product.name,
+        'unit_price': product.price,
+        'quantity': quantity,
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow()
+    }
+    stmt = upsert_insert(CartItem)
+    if stmt is not None:
+        stmt = stmt.values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.session_id, CartItem.product_id],
+            set_={
+                'quantity': CartItem.quantity + stmt.excluded.quantity,
+                'unit_price': stmt.excluded.unit_price,
+                'product_name': stmt.excluded.product_name,
+                'updated_at': stmt.excluded.updated_at
+            }
+        ).returning(CartItem.quantity)
+        new_quantity = db.session.execute(stmt).scalar_one()
+    else:
+        new_quantity = _add_without_upsert(values)
+    db.session.commit()
+    # Only a freshly inserted line ends up with exactly the added quantity
+    _refresh_counts(lines_delta=1 if new_quantity == quantity else 0, count_delta=quantity)
+    return new_quantity
+
+
+def _add_without_upsert(values):
+    """add_to_cart for databases without ON CONFLICT: UPDATE, else INSERT"""
+    line = (CartItem.session_id == values['session_id'], CartItem.product_id == values['product_id'])
+    for _ in range(2):
+        updated = db.session.execute(
+            update(CartItem).where(*line).values(
+                quantity=CartItem.quantity + values['quantity'],
+                unit_price=values['unit_price'],
+                product_name=values['product_name'],
+                updated_at=values['updated_at']
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        if updated:
+            return db.session.query(CartItem.quantity).filter(*line).scalar()
+        try:
+            with db.session.begin_nested():
+                db.session.execute(CartItem.__table__.insert().values(**values))
+            return values['quantity']
+        except IntegrityError:
+            continue  # another request inserted the line first, add to it
+    raise RuntimeError('Cart line kept changing under us')
+
+
+def set_cart_quantity(product_id, quantity):
+    """Set a line's quantity in one UPDATE, False if the line doesn't exist"""
+    if quantity < 1:
+        return remove_from_cart(product_id)
+    result = db.session.execute(
+        update(CartItem)
+        .where(CartItem.session_id == _cart_session_id(), CartItem.product_id == product_id)
+        .values(quantity=quantity)
+    )
+    db.session.commit()
+    _refresh_counts()
+    return result.rowcount > 0
+
+
+def set_cart_quantities(quantities):
+    """Apply {product_id: quantity} to the cart in one transaction.
+
+    All updates go out as a single UPDATE ... SET quantity = CASE, and
+    lines set to 0 as a single DELETE.
+    """
+    session_id = _cart_session_id()
+    updates = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    removals = [product_id for product_id, quantity in quantities.items() if quantity < 1]
+    try:
+        if updates:
+            db.session.execute(
+                update(CartItem)
+                .where(CartItem.session_id == session_id, CartItem.product_id.in_(updates))
+                .values(quantity=case(updates, value=CartItem.product_id))
+                .execution_options(synchronize_session=False)
+            )
+        if removals:
+            db.session.execute(
+                delete(CartItem)
+                .where(CartItem.session_id == session_id, CartItem.product_id.in_(removals))
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    _refresh_counts()
+
+
+def remove_from_cart(product_id):
+    """Delete a line in one DELETE, False if it wasn't in the cart"""
+    result = db.session.execute(
+        delete(CartItem)
+        .where(CartItem.session_id == _cart_session_id(), CartItem.product_id == product_id)
+    )
+    db.session.commit()
+    _refresh_counts()
+    return result.rowcount > 0
 
 
 def clear_cart():
     """Clear cart from database and session"""
+    forget_cart()
     session_id = session.get('cart_id')
     if session_id:
         CartItem.query.filter_by(session_id=session_id).delete()
         db.session.commit()
-        session.pop('cart_id', None)
\ No newline at end of file
+        session.pop('cart_id', None)
+        session.pop('cart_lines', None)
+        session.pop('cart_count', None)
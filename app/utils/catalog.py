@@ -0,0 +1,197 @@
+import base64
+import json
+import math
+from collections import namedtuple
+from sqlalchemy import func, tuple_
+from app import db
+from app.forms import CATEGORY_CHOICES, SIZE_CHOICES
+from app.models import Product
+from app.utils.stock import buyable_stock
+
+
+# Templates cut descriptions at 100 characters, one extra character is
+# enough for them to know whether to add an ellipsis
+DESCRIPTION_PREVIEW_LENGTH = 101
+
+# Compact read model for catalog pages - only what the listing templates use.
+# stock is what can still be bought: stock minus other orders' active holds
+ProductCard = namedtuple('ProductCard', [
+    'id', 'name', 'description', 'category', 'size', 'stock', 'price',
+    'image_digest', 'image_variants'
+])
+
+# Everything products/details.html shows
+ProductDetail = namedtuple('ProductDetail', ProductCard._fields + ('available',))
+
+# Even smaller row for the admin low-stock panel
+StockRow = namedtuple('StockRow', ['id', 'name', 'category', 'stock'])
+
+
+def _card_query():
+    return db.session.query(
+        Product.id,
+        Product.name,
+        func.substr(Product.description, 1, DESCRIPTION_PREVIEW_LENGTH),
+        Product.category,
+        Product.size,
+        buyable_stock().label('stock'),
+        Product.price,
+        Product.image_digest,
+        Product.image_variants
+    )
+
+
+def _to_card(row):
+    card = ProductCard._make(row)
+    # Plain float so templates never see a Decimal from the driver
+    return card._replace(price=float(card.price))
+
+
+PAGE_SIZE = 12
+
+# Listing sort orders - every key in one order runs in the same direction
+# and ends with Product.id, so (key..., id) is a usable keyset cursor
+SORT_OPTIONS = {
+    'newest': ('Newest', [Product.id], True),
+    'price_asc': ('Price: low to high', [Product.price, Product.id], False),
+    'price_desc': ('Price: high to low', [Product.price, Product.id], True),
+    'name': ('Name', [Product.name, Product.id], False),
+}
+DEFAULT_SORT = 'newest'
+
+ListingFilters = namedtuple('ListingFilters', ['category', 'size', 'min_price', 'max_price', 'sort'])
+
+
+def _parse_price(value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price >= 0 else None
+
+
+def parse_filters(args):
+    """Build ListingFilters from query args, silently dropping invalid values"""
+    category = args.get('category')
+    size = args.get('size')
+    sort = args.get('sort')
+    return ListingFilters(
+        category=category if category in dict(CATEGORY_CHOICES) else None,
+        size=size if size in dict(SIZE_CHOICES) else None,
+        min_price=_parse_price(args.get('min_price')),
+        max_price=_parse_price(args.get('max_price')),
+        sort=sort if sort in SORT_OPTIONS else DEFAULT_SORT
+    )
+
+
+def filter_args(filters):
+    """Query args that reproduce the given filters, for building page links"""
+    return {key: value for key, value in filters._asdict().items()
+            if value is not None and not (key == 'sort' and value == DEFAULT_SORT)}
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _cursor_value_ok(key, value):
+    """Whether a decoded cursor value can be compared with the sort key column"""
+    python_type = key.type.python_type
+    if isinstance(value, bool):
+        return False
+    if python_type is str:
+        return isinstance(value, str) and '\x00' not in value
+    if python_type is int:
+        return isinstance(value, int)
+    return isinstance(value, (int, float)) and math.isfinite(value)
+
+
+def decode_cursor(cursor, keys):
+    """Cursor values for the sort keys, or None when the cursor is missing or malformed.
+
+    Values are type-checked against the key columns, so a crafted cursor
+    falls back to the first page instead of failing in the database.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(keys):
+        return None
+    if not all(_cursor_value_ok(key, value) for key, value in zip(keys, values)):
+        return None
+    return values
+
+
+def product_page(filters, cursor=None, per_page=PAGE_SIZE):
+    """One page of in-stock products using keyset pagination.
+
+    Returns (cards, next_cursor); next_cursor is None on the last page.
+    """
+    _, keys, descending = SORT_OPTIONS[filters.sort]
+
+    query = _card_query().filter(Product.available == True, buyable_stock() > 0)
+    if filters.category:
+        query = query.filter(Product.category == filters.category)
+    if filters.size:
+        query = query.filter(Product.size == filters.size)
+    if filters.min_price is not None:
+        query = query.filter(Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        query = query.filter(Product.price <= filters.max_price)
+
+    after = decode_cursor(cursor, keys)
+    if after is not None:
+        position = tuple_(*keys)
+        query = query.filter(position < tuple_(*after) if descending else position > tuple_(*after))
+
+    query = query.order_by(*[key.desc() if descending else key.asc() for key in keys])
+    cards = [_to_card(row) for row in query.limit(per_page + 1).all()]
+
+    next_cursor = None
+    if len(cards) > per_page:
+        cards = cards[:per_page]
+        last = cards[-1]
+        next_cursor = encode_cursor([getattr(last, key.key) for key in keys])
+    return cards, next_cursor
+
+
+def cards_by_ids(product_ids):
+    """Product cards for the given ids, in the same order"""
+    if not product_ids:
+        return []
+    rows = _card_query().filter(Product.id.in_(product_ids)).all()
+    cards = {row.id: _to_card(row) for row in rows}
+    return [cards[product_id] for product_id in product_ids if product_id in cards]
+
+
+def product_detail(product_id):
+    """Read model for the product details page, or None"""
+    row = db.session.query(
+        Product.id,
+        Product.name,
+        Product.description,
+        Product.category,
+        Product.size,
+        buyable_stock().label('stock'),
+        Product.price,
+        Product.image_digest,
+        Product.image_variants,
+        Product.available
+    ).filter(Product.id == product_id).first()
+    if row is None:
+        return None
+    detail = ProductDetail._make(row)
+    return detail._replace(price=float(detail.price))
+
+
+def low_stock_products(threshold=5):
+    """Available products running low on stock, for the admin dashboard"""
+    rows = db.session.query(
+        Product.id, Product.name, Product.category, Product.stock
+    ).filter(Product.stock < threshold, Product.available == True).all()
+    return [StockRow._make(row) for row in rows]
@@ -0,0 +1,152 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event, insert, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import CacheVersion
+
+
+# Name of the shared version stamp bumped on every catalog write
+CATALOG = 'catalog'
+# Bumped only when products themselves are created, edited or deleted
+PRODUCTS = 'products'
+
+
+def get_version(name):
+    """Current value of a shared version stamp"""
+    return db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+
+
+def bump_version(name):
+    """Increment a shared version stamp inside the current transaction"""
+    stmt = update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1)
+    if db.session.execute(stmt).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(CacheVersion).values(name=name, version=1))
+    except IntegrityError:
+        # Another worker created the row first
+        db.session.execute(stmt)
+
+
+class CatalogCache:
+    """Process-local cache for catalog reads.
+
+    Entries expire after CATALOG_CACHE_TTL seconds and are dropped as soon
+    as the shared catalog version moves on. The version is re-read from the
+    database at most every CATALOG_VERSION_CHECK_INTERVAL seconds, so writes
+    made by other gunicorn workers are picked up within that interval while
+    a cache hit normally costs no query at all.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def current_version(self):
+        now = time.monotonic()
+        interval = current_app.config['CATALOG_VERSION_CHECK_INTERVAL']
+        if self._version is None or now - self._version_checked_at >= interval:
+            version = get_version(CATALOG)
+            with self._lock:
+                if version != self._version:
+                    if self._entries:
+                        self.invalidations += 1
+                    self._entries.clear()
+                    self._version = version
+                self._version_checked_at = now
+        return self._version
+
+    def get(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss"""
+        if not current_app.config['CATALOG_CACHE_ENABLED']:
+            return loader()
+
+        version = self.current_version()
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version and entry[1] > now:
+            with self._lock:
+                self.hits += 1
+            return entry[2]
+
+        value = loader()
+        with self._lock:
+            self.misses += 1
+            # Keys include user-supplied filters, so keep the table bounded
+            if key not in self._entries and len(self._entries) >= current_app.config['CATALOG_CACHE_MAX_ENTRIES']:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (version, now + current_app.config['CATALOG_CACHE_TTL'], value)
+        return value
+
+    def mark_stale(self):
+        """Force the next read to re-check the shared version"""
+        with self._lock:
+            self._version_checked_at = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'invalidations': self.invalidations,
+            'entries': len(self._entries),
+            'version': self._version
+        }
+
+
+catalog_cache = CatalogCache()
+
+
+def invalidate_catalog():
+    """Call before committing a product create, edit or delete"""
+    bump_version(CATALOG)
+    bump_version(PRODUCTS)
+    db.session.info['catalog_changed'] = True
+
+
+def invalidate_catalog_after_commit():
+    """Bump the catalog version when the current transaction commits.
+
+    For every stock or hold change, since listings show exact counts.
+    The bump is the transaction's last statement, so the shared
+    cache_version row is only locked for the commit itself, never for
+    as long as an order. It rides on the session's own connection: a
+    bump in a separate transaction after the commit would need a second
+    pooled connection per request and starve the pool under load.
+    Several changes in one transaction bump it once.
+    """
+    db.session.info['catalog_bump'] = True
+
+
+@event.listens_for(db.session, 'before_commit')
+def _catalog_committing(session):
+    if session.info.pop('catalog_bump', False):
+        bump_version(CATALOG)
+        session.info['catalog_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _catalog_committed(session):
+    # The bump is only visible once committed, re-check right away
+    if session.info.pop('catalog_changed', False):
+        catalog_cache.mark_stale()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _catalog_rolled_back(session):
+    session.info.pop('catalog_changed', None)
+    session.info.pop('catalog_bump', None)
@@ -0,0 +1,215 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import and_, or_, update
+import stripe
+from app import db
+from app.models import CheckoutOutbox, Order
+from app.utils.idempotency import settle_orphaned_keys
+from app.utils.stock import release_order_stock
+from app.utils.stripe_service import create_checkout_session, checkout_session_expiry
+
+
+# Worth another attempt with the same idempotency key, after a pause
+RETRYABLE_ERRORS = (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+# Stripe refused the request outright, so no session exists for it
+NO_SESSION_ERRORS = (stripe.error.InvalidRequestError, stripe.error.AuthenticationError)
+
+# In-request backoff between attempts, in seconds
+SEND_BACKOFF = 0.5
+SEND_BACKOFF_MAX = 2
+# Longest the relay waits before trying an entry again, in seconds
+RELAY_BACKOFF_MAX = 900
+
+
+def enqueue_checkout_session(order, amount, customer_email, success_url, cancel_url):
+    """Record the Stripe session to create for an order.
+
+    Call inside the order's transaction: the order, its stock holds and
+    this entry commit together or not at all.
+    """
+    entry = CheckoutOutbox(order_id=order.id, payload={
+        'amount': str(amount),
+        'customer_email': customer_email,
+        'success_url': success_url,
+        'cancel_url': cancel_url
+    })
+    db.session.add(entry)
+    return entry
+
+
+def _create(entry):
+    """Ask Stripe for the entry's session, always with the same key and parameters"""
+    payload = entry.payload
+    return create_checkout_session(
+        order_id=entry.order_id,
+        amount=Decimal(payload['amount']),
+        customer_email=payload['customer_email'],
+        success_url=payload['success_url'],
+        cancel_url=payload['cancel_url'],
+        expires_at=datetime.fromisoformat(payload['expires_at']),
+        # One Stripe key per order: the form's idempotency key only
+        # dedupes the POST, a resubmitted form is a new order
+        idempotency_key=f'checkout-outbox-{entry.id}'
+    )
+
+
+def _abandon(entry, status, error):
+    """Compensate an order whose Stripe session will never be paid"""
+    order = db.session.get(Order, entry.order_id)
+    if order is not None and order.payment_status == 'Pending':
+        release_order_stock(order)
+        order.status = 'Cancelled'
+        order.payment_status = 'Failed'
+    entry.status = status
+    entry.last_error = error
+    entry.processed_at = datetime.utcnow()
+
+
+def _hand_to_relay(entry, attempts, error):
+    """Leave an entry Stripe may or may not have acted on to the relay. Commits."""
+    db.session.rollback()
+    db.session.execute(
+        update(CheckoutOutbox)
+        .where(CheckoutOutbox.id == entry.id, CheckoutOutbox.status == 'pending')
+        .values(status='cancelling', attempts=attempts, last_error=str(error),
+                next_attempt_at=datetime.utcnow() + timedelta(seconds=current_app.config['CHECKOUT_OUTBOX_RETRY_SECONDS']))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def send_checkout_session(entry):
+    """Create the entry's Stripe session, outside any stock locks.
+
+    Every attempt uses the same idempotency key, so a retry after a
+    timeout gets the session Stripe already made instead of a second
+    one. Returns the session and re-raises the error on failure. When
+    Stripe refused the request the order is cancelled and its stock
+    released at once; when the outcome is unknown the entry goes to
+    relay_checkout_outbox, which cancels it only after checking.
+    """
+    if 'expires_at' not in entry.payload:
+        # Fixed right before the first call and stored, so every retry sends
+        # Stripe the same parameters under the entry's idempotency key
+        entry.payload = dict(entry.payload, expires_at=checkout_session_expiry().isoformat())
+        db.session.commit()
+    max_attempts = current_app.config['CHECKOUT_OUTBOX_MAX_ATTEMPTS']
+    attempts = entry.attempts
+    for attempt in range(1, max_attempts + 1):
+        attempts += 1
+        try:
+            session = _create(entry)
+            break
+        except RETRYABLE_ERRORS as e:
+            error = e
+            if attempt < max_attempts:
+                time.sleep(min(SEND_BACKOFF * 2 ** (attempt - 1), SEND_BACKOFF_MAX))
+        except NO_SESSION_ERRORS as e:
+            entry.attempts = attempts
+            _abandon(entry, 'failed', str(e))
+            db.session.commit()
+            raise
+        except Exception as e:
+            _hand_to_relay(entry, attempts, e)
+            raise
+    else:
+        _hand_to_relay(entry, attempts, error)
+        raise error
+
+    # Only claim the entry if the relay hasn't taken it over meanwhile
+    sent = db.session.execute(
+        update(CheckoutOutbox)
+        .where(CheckoutOutbox.id == entry.id, CheckoutOutbox.status == 'pending')
+        .values(status='sent', attempts=attempts, processed_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not sent:
+        db.session.rollback()
+        raise RuntimeError(f'Checkout for order #{entry.order_id} was abandoned before Stripe answered')
+    db.session.execute(
+        update(Order).where(Order.id == entry.order_id).values(stripe_session_id=session.id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return session
+
+
+def _retry_later(entry, error):
+    entry.attempts += 1
+    entry.last_error = str(error)
+    delay = min(current_app.config['CHECKOUT_OUTBOX_RETRY_SECONDS'] * 2 ** (entry.attempts - 1), RELAY_BACKOFF_MAX)
+    entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+    current_app.logger.warning(f'Checkout for order #{entry.order_id} retries in {delay}s: {str(error)}')
+
+
+def _settle(entry):
+    """Recover, expire and cancel one entry. False when it has to wait for a retry."""
+    if 'expires_at' not in entry.payload:
+        _abandon(entry, 'abandoned', 'The request died before calling Stripe')
+        return True
+    try:
+        session = _create(entry)
+    except NO_SESSION_ERRORS as e:
+        _abandon(entry, 'abandoned', str(e))
+        return True
+    except stripe.error.StripeError as e:
+        _retry_later(entry, e)
+        return False
+
+    # Nobody has this session's URL, close it before giving the stock back
+    try:
+        stripe.checkout.Session.expire(session.id)
+    except stripe.error.InvalidRequestError as e:
+        # Not open any more: it expired already, or the customer paid it
+        try:
+            session = stripe.checkout.Session.retrieve(session.id)
+        except stripe.error.StripeError as retrieve_error:
+            _retry_later(entry, retrieve_error)
+            return False
+        if session.status == 'complete':
+            # The webhook records the payment
+            entry.status = 'sent'
+            entry.processed_at = datetime.utcnow()
+            db.session.get(Order, entry.order_id).stripe_session_id = session.id
+            return True
+        if session.status == 'open':
+            _retry_later(entry, e)
+            return False
+    except stripe.error.StripeError as e:
+        _retry_later(entry, e)
+        return False
+    _abandon(entry, 'abandoned', f'Checkout session {session.id} expired unused')
+    return True
+
+
+def relay_checkout_outbox(batch_size=None, max_batches=None):
+    """Settle outbox entries whose request never got a session back, in bounded batches.
+
+    Takes the entries send_checkout_session handed over and pending
+    ones older than CHECKOUT_OUTBOX_STALE_SECONDS, whose request died.
+    Each is resent under its idempotency key, which returns any session
+    Stripe already made; that session is expired, unless it was paid,
+    and only then is the order cancelled and its stock released. Stripe
+    errors back off and retry on a later run. Place-order keys the dead
+    requests left behind are settled too. Returns the count settled.
+    """
+    batch_size = batch_size or current_app.config['STOCK_HOLD_BATCH_SIZE']
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=current_app.config['CHECKOUT_OUTBOX_STALE_SECONDS'])
+    settled = batches = 0
+    while max_batches is None or batches < max_batches:
+        entries = CheckoutOutbox.query.filter(
+            or_(CheckoutOutbox.status == 'cancelling',
+                and_(CheckoutOutbox.status == 'pending', CheckoutOutbox.created_at < cutoff)),
+            or_(CheckoutOutbox.next_attempt_at.is_(None), CheckoutOutbox.next_attempt_at <= now)
+        ).order_by(CheckoutOutbox.created_at).limit(batch_size).with_for_update(skip_locked=True).all()
+        if not entries:
+            break
+        for entry in entries:
+            settled += _settle(entry)
+        db.session.commit()
+        batches += 1
+    settle_orphaned_keys()
+    return settled
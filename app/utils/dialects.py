@@ -0,0 +1,17 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+
+
+def upsert_insert(table):
+    """INSERT for a model or table that supports ON CONFLICT clauses.
+
+    Postgres and SQLite both have them. On any other database this
+    returns None, and callers fall back to an UPDATE followed by an
+    INSERT that retries on IntegrityError.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    return None
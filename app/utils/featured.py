@@ -0,0 +1,49 @@
+import heapq
+import random
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models import Product, Order, OrderItem
+from app.utils.catalog import cards_by_ids
+from app.utils.catalog_cache import catalog_cache
+from app.utils.stock import buyable_stock
+
+
+def featured_pool():
+    """(product_id, weight) for every listed product.
+
+    Weight is 1 plus the units sold over the last FEATURED_SALES_WINDOW_DAYS,
+    so best sellers come up more often but every product gets a turn.
+    """
+    since = datetime.utcnow() - timedelta(days=current_app.config['FEATURED_SALES_WINDOW_DAYS'])
+    sales = db.session.query(
+        OrderItem.product_id.label('product_id'),
+        func.sum(OrderItem.quantity).label('sold')
+    ).join(Order, Order.id == OrderItem.order_id).filter(
+        Order.order_date >= since,
+        Order.status != 'Cancelled'
+    ).group_by(OrderItem.product_id).subquery()
+
+    rows = db.session.query(Product.id, func.coalesce(sales.c.sold, 0)).outerjoin(
+        sales, sales.c.product_id == Product.id
+    ).filter(Product.available == True, buyable_stock() > 0).all()
+    return [(product_id, 1 + max(int(sold), 0)) for product_id, sold in rows]
+
+
+def sample_ids(pool, count):
+    """Weighted sample without replacement (Efraimidis-Spirakis)"""
+    return [product_id for _, product_id in heapq.nlargest(
+        count, ((random.random() ** (1.0 / weight), product_id) for product_id, weight in pool)
+    )]
+
+
+def featured_products(count=None):
+    """Product cards for the homepage, a fresh weighted pick per request.
+
+    The candidate pool is cached with the catalog, so a request costs one
+    primary-key lookup for the chosen cards instead of ORDER BY random().
+    """
+    count = count or current_app.config['FEATURED_COUNT']
+    pool = catalog_cache.get('featured_pool', featured_pool)
+    return cards_by_ids(sample_ids(pool, count))
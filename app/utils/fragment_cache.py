@@ -0,0 +1,104 @@
+import json
+import threading
+from collections import OrderedDict
+from flask import current_app
+from markupsafe import Markup
+
+
+# Card fields that change what a product fragment renders. The variants
+# are listed too: they are regenerated (or backfilled) separately from
+# the original image, and the srcset renders their widths and formats.
+VERSION_FIELDS = ('name', 'description', 'category', 'size', 'stock', 'price', 'image_digest', 'image_variants')
+
+
+def _hashable(value):
+    # JSON columns (image_variants) come back as dicts
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def product_version(product):
+    """Content version of a product row, changes whenever its card would"""
+    return tuple(_hashable(getattr(product, field, None)) for field in VERSION_FIELDS)
+
+
+class FragmentCache:
+    """Process-local LRU of rendered template fragments.
+
+    Bounded by the total size of the cached markup
+    (FRAGMENT_CACHE_MAX_BYTES, 0 disables it). Keys carry the version of
+    whatever the fragment renders, so stale entries are never served,
+    they just age out of the LRU.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, render):
+        """Return the cached fragment for key, calling render() on a miss"""
+        max_bytes = current_app.config['FRAGMENT_CACHE_MAX_BYTES']
+        if not max_bytes:
+            return render()
+
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+
+        html = Markup(render())
+        with self._lock:
+            self.misses += 1
+            if key not in self._entries and len(html) <= max_bytes:
+                self._entries[key] = html
+                self.size += len(html)
+                while self.size > max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+                    self.evictions += 1
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.size
+        }
+
+
+fragment_cache = FragmentCache()
+
+
+def cached_fragment(name, product=None, *vary, caller):
+    """Jinja helper: {% call cached_fragment('card', product) %}...{% endcall %}
+
+    The block body is rendered once per product version (plus any extra
+    `vary` values) and reused until it changes. `product` may also be a
+    list, for a block that renders several products (the featured
+    block): the key then covers each product's id and version, in order.
+    Never put per-user or per-request output such as CSRF tokens inside
+    the block.
+    """
+    if isinstance(product, list):
+        key = (name, tuple((item.id, product_version(item)) for item in product)) + vary
+    elif product is not None:
+        key = (name, product.id, product_version(product)) + vary
+    else:
+        key = (name,) + vary
+    return fragment_cache.get(key, caller)
@@ -0,0 +1,154 @@
+import secrets
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import IdempotencyKey, Order
+
+
+def new_idempotency_key():
+    """Key for one rendering of the place-order form"""
+    return secrets.token_urlsafe(24)
+
+
+def _stale_before():
+    """Claims older than this belong to a request that died"""
+    return datetime.utcnow() - timedelta(seconds=current_app.config['IDEMPOTENCY_PROCESSING_SECONDS'])
+
+
+def is_orphaned(status, order_id, claimed_at):
+    """Whether a key is stuck 'processing' without its request or an order"""
+    return status == 'processing' and order_id is None and (claimed_at is None or claimed_at < _stale_before())
+
+
+def _take_over(existing):
+    """Claim a key whose request died before committing an order, True if we won it"""
+    taken = db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == existing.id, IdempotencyKey.status == 'processing',
+               IdempotencyKey.order_id.is_(None), IdempotencyKey.claimed_at == existing.claimed_at)
+        .values(claimed_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return bool(taken)
+
+
+def claim_idempotency_key(user_id, key):
+    """Start processing key for user_id, or find who already did.
+
+    Inserts and commits the key row on its own so a concurrent duplicate
+    sees it straight away. A key left 'processing' for longer than
+    IDEMPOTENCY_PROCESSING_SECONDS without an order is taken over.
+    Returns None when this request owns the key, otherwise the existing
+    IdempotencyKey row.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=current_app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+    for _ in range(2):
+        try:
+            db.session.add(IdempotencyKey(user_id=user_id, key=key, claimed_at=now, expires_at=expires_at))
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+        existing = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+        if existing is None:
+            continue  # released by its owner in the meantime, try again
+        if existing.expires_at <= now:
+            db.session.delete(existing)
+            db.session.commit()
+            continue
+        if is_orphaned(existing.status, existing.order_id, existing.claimed_at) and _take_over(existing):
+            return None
+        return existing
+    return IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+
+
+def idempotency_result(user_id, key):
+    """(status, redirect_url, order_id, claimed_at) of a claimed key, None if it was released"""
+    return db.session.execute(
+        select(IdempotencyKey.status, IdempotencyKey.redirect_url, IdempotencyKey.order_id, IdempotencyKey.claimed_at)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    ).first()
+
+
+def link_idempotency_key(user_id, key, order_id):
+    """Attach the new order to the key, inside the order's transaction"""
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(order_id=order_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def complete_idempotency_key(user_id, key, redirect_url):
+    """Record the result repeated posts of key are sent to"""
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(status='completed', redirect_url=redirect_url)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def release_idempotency_key(user_id, key):
+    """Forget a key whose request failed, so posting it again tries afresh"""
+    db.session.rollback()
+    db.session.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def settle_orphaned_keys(batch_size=1000):
+    """Resolve keys left 'processing' by requests that died, returns the count.
+
+    Once the order a dead request committed is settled by the outbox
+    relay, its key is completed (paid, a repeated post shows the order)
+    or deleted (cancelled, so posting the form again tries afresh). Keys
+    that never got an order are deleted.
+    """
+    stale = db.session.query(IdempotencyKey.id, IdempotencyKey.order_id, Order.payment_status).outerjoin(
+        Order, Order.id == IdempotencyKey.order_id
+    ).filter(
+        IdempotencyKey.status == 'processing',
+        IdempotencyKey.claimed_at < _stale_before(),
+        or_(Order.id.is_(None), Order.payment_status != 'Pending')
+    ).limit(batch_size).all()
+    paid = [key_id for key_id, order_id, payment_status in stale if payment_status == 'Paid']
+    dead = [key_id for key_id, order_id, payment_status in stale if payment_status != 'Paid']
+    if paid:
+        db.session.execute(
+            update(IdempotencyKey).where(IdempotencyKey.id.in_(paid), IdempotencyKey.status == 'processing')
+            .values(status='completed').execution_options(synchronize_session=False)
+        )
+    if dead:
+        db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.id.in_(dead), IdempotencyKey.status == 'processing')
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return len(stale)
+
+
+def purge_expired_keys(batch_size=1000, max_batches=None):
+    """Delete expired idempotency keys in bounded batches, returns the count"""
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.session.execute(
+            select(IdempotencyKey.id).where(IdempotencyKey.expires_at <= datetime.utcnow()).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        deleted += db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        batches += 1
+    return deleted
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timezone
+from flask import current_app
+
+
+# Magic numbers for the image formats we accept on upload
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+def detect_mimetype(data):
+    """Detect image MIME type from the leading bytes"""
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'image/avif'
+    return 'application/octet-stream'
+
+
+def compute_digest(data):
+    """SHA-256 hex digest used as the blob address"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageStore:
+    """Base class for content-addressed image storage backends.
+
+    Blobs are addressed by the SHA-256 of their content, so storing the same
+    image twice is a no-op and a digest always maps to the same bytes.
+    """
+
+    def put(self, data):
+        raise NotImplementedError
+
+    def get(self, digest):
+        raise NotImplementedError
+
+    def exists(self, digest):
+        raise NotImplementedError
+
+    def delete(self, digest):
+        raise NotImplementedError
+
+    def path(self, digest):
+        """Local filesystem path for the blob, or None if not file-backed"""
+        return None
+
+    def modified_at(self, digest):
+        """UTC datetime the blob was first stored, or None if unknown"""
+        return None
+
+
+class LocalImageStore(ImageStore):
+    """Stores blobs on local disk under <root>/<ab>/<cd>/<digest>"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data):
+        digest = compute_digest(data)
+        target = self.path(digest)
+        if os.path.exists(target):
+            return digest
+
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temp file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest):
+        try:
+            with open(self.path(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def modified_at(self, digest):
+        try:
+            return datetime.fromtimestamp(os.path.getmtime(self.path(digest)), timezone.utc)
+        except OSError:
+            return None
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+# Backends selectable through IMAGE_STORE_BACKEND
+BACKENDS = {
+    'local': lambda app: LocalImageStore(app.config['IMAGE_STORE_PATH']),
+}
+
+
+def get_image_store():
+    """Get the configured image store for the current app"""
+    app = current_app._get_current_object()
+    store = app.extensions.get('image_store')
+    if store is None:
+        backend = app.config.get('IMAGE_STORE_BACKEND', 'local')
+        store = BACKENDS[backend](app)
+        app.extensions['image_store'] = store
+    return store
+
+
+def save_product_image(product, data):
+    """Store image bytes and point the product at the stored blob"""
+    product.image_digest = get_image_store().put(data)
+    product.image_size = len(data)
+    product.image_mime = detect_mimetype(data)
+
+
+def load_product_image(product):
+    """Load the raw image bytes for a product, or None"""
+    if not product.image_digest:
+        return None
+    return get_image_store().get(product.image_digest)
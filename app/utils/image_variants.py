@@ -0,0 +1,115 @@
+import io
+from flask import current_app, url_for
+from app.utils.image_store import get_image_store
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow missing - originals are served as-is
+    Image = None
+
+
+# Bounding boxes for the derivatives we serve (2x the CSS size they are shown at)
+VARIANTS = {
+    'thumb': (160, 160),
+    'card': (480, 400),
+    'detail': (1200, 1200),
+}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def _encode(img, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        img.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'png':
+        img.save(buffer, 'PNG', optimize=True)
+    else:
+        img.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def generate_variants(data):
+    """Build resized WebP + JPEG/PNG derivatives of an image.
+
+    Returns the structure stored in Product.image_variants:
+    {'thumb': {'width': w, 'height': h, 'formats': {'webp': digest, 'jpeg': digest}}, ...}
+    or None when Pillow is unavailable or the image can't be decoded.
+    """
+    if Image is None:
+        return None
+
+    try:
+        source = Image.open(io.BytesIO(data))
+        source = ImageOps.exif_transpose(source)
+        source.load()
+    except Exception as e:
+        current_app.logger.warning(f'Could not decode product image: {str(e)}')
+        return None
+
+    has_alpha = source.mode in ('RGBA', 'LA') or 'transparency' in source.info
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpeg'
+
+    store = get_image_store()
+    variants = {}
+    for name, box in VARIANTS.items():
+        img = source.copy()
+        img.thumbnail(box, Image.LANCZOS)  # only ever downscales
+        variants[name] = {
+            'width': img.width,
+            'height': img.height,
+            'formats': {
+                'webp': store.put(_encode(img, 'webp')),
+                fallback: store.put(_encode(img, fallback)),
+            }
+        }
+    return variants
+
+
+def save_product_variants(product, data):
+    """Generate and attach image derivatives to a product"""
+    product.image_variants = generate_variants(data)
+
+
+def variant_digest(product, variant, fmt=None):
+    """Pick the stored digest and format for a variant, or (None, None)"""
+    entry = (product.image_variants or {}).get(variant)
+    if not entry:
+        return None, None
+    formats = entry['formats']
+    if fmt not in formats:
+        fmt = next(f for f in formats if f != 'webp')
+    return formats[fmt], fmt
+
+
+# Length of the digest prefix used as the ?v= cache-busting version
+URL_VERSION_LENGTH = 12
+
+
+def image_version(product):
+    """Short version stamp for image URLs, changes whenever the image does"""
+    return product.image_digest[:URL_VERSION_LENGTH] if product.image_digest else None
+
+
+def product_image_url(product, variant=None, fmt=None):
+    """Versioned products.product_image URL, safe to cache forever"""
+    return url_for('products.product_image', id=product.id, variant=variant,
+                   format=fmt, v=image_version(product))
+
+
+def product_srcset(product, fmt=None):
+    """srcset attribute value covering every generated variant width"""
+    variants = product.image_variants or {}
+    candidates = []
+    widths = set()
+    for name, entry in sorted(variants.items(), key=lambda item: item[1]['width']):
+        # Small originals produce identical variants, list each width once
+        if entry['width'] in widths or (fmt and fmt not in entry['formats']):
+            continue
+        widths.add(entry['width'])
+        url = product_image_url(product, variant=name, fmt=fmt)
+        candidates.append(f"{url} {entry['width']}w")
+    return ', '.join(candidates)
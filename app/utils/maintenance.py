@@ -0,0 +1,71 @@
+import threading
+import time
+from flask import current_app
+from app import db
+
+
+def _release_expired_holds():
+    from app.utils.stock import release_expired_holds
+    return f'released stock held by {release_expired_holds()} expired orders'
+
+
+def _relay_checkout_outbox():
+    from app.utils.checkout_outbox import relay_checkout_outbox
+    return f'settled {relay_checkout_outbox()} checkouts that never got a Stripe session back'
+
+
+def _purge_idempotency_keys():
+    from app.utils.idempotency import purge_expired_keys
+    return f'purged {purge_expired_keys()} expired idempotency keys'
+
+
+def _purge_sessions():
+    if current_app.config['SESSION_BACKEND'] != 'sqlalchemy':
+        return 'no server-side sessions'
+    from app.utils.sessions import purge_expired_sessions
+    return f"purged {purge_expired_sessions(current_app.config['SESSION_PURGE_BATCH_SIZE'])} expired sessions"
+
+
+# Checkout housekeeping, in the order it runs
+MAINTENANCE_JOBS = [
+    ('release-expired-holds', _release_expired_holds),
+    ('relay-checkout-outbox', _relay_checkout_outbox),
+    ('purge-idempotency-keys', _purge_idempotency_keys),
+    ('purge-sessions', _purge_sessions),
+]
+
+
+def run_maintenance():
+    """Run every maintenance job once, each on its own.
+
+    A failing job is rolled back and logged without stopping the ones
+    after it. Returns {job name: summary or error message}.
+    """
+    results = {}
+    for name, job in MAINTENANCE_JOBS:
+        try:
+            results[name] = job()
+            current_app.logger.info(f'Maintenance {name}: {results[name]}')
+        except Exception as e:
+            db.session.rollback()
+            results[name] = f'failed: {str(e)}'
+            current_app.logger.error(f'Maintenance {name} failed: {str(e)}')
+    return results
+
+
+def start_maintenance_scheduler(app):
+    """Run run_maintenance every MAINTENANCE_INTERVAL seconds"""
+    interval = app.config['MAINTENANCE_INTERVAL']
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    run_maintenance()
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='maintenance', daemon=True)
+    thread.start()
+    return thread
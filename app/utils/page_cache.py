@@ -0,0 +1,179 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import request, session, g, current_app
+from flask_wtf.csrf import generate_csrf
+from app.utils.catalog_cache import catalog_cache
+
+
+# Endpoints whose anonymous HTML is the same for every visitor, mapped
+# to the query args that change it. Anything else in the query string
+# is ignored, so tracking parameters don't fragment the cache.
+CACHEABLE_ENDPOINTS = {
+    'main.about': (),
+    'main.contact': (),
+    'main.terms': (),
+    'main.privacy': (),
+    'products.index': ('category', 'size', 'min_price', 'max_price', 'sort', 'cursor'),
+}
+
+# Stands in for the per-session CSRF token inside cached bodies
+CSRF_PLACEHOLDER = b'\x00csrf-token\x00'
+
+
+class PageCache:
+    """Process-local LRU of whole anonymous responses.
+
+    Entries expire after PAGE_CACHE_TTL seconds and are dropped when the
+    shared catalog version moves on, same as the catalog cache.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        version = catalog_cache.current_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['version'] != version or entry['expires'] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype):
+        entry = {
+            'body': body,
+            'mimetype': mimetype,
+            'etag': hashlib.sha1(body).hexdigest()[:16],
+            'version': catalog_cache.current_version(),
+            'expires': time.monotonic() + current_app.config['PAGE_CACHE_TTL']
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > current_app.config['PAGE_CACHE_MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'entries': len(self._entries)
+        }
+
+
+page_cache = PageCache()
+
+
+def _is_anonymous():
+    """Cheap check that the request renders the plain logged-out page"""
+    if '_user_id' in session or request.cookies.get(current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token')):
+        return False
+    if '_flashes' in session:
+        return False
+    # Anonymous carts show a badge, only empty ones share a page
+    if session.get('cart_id') and session.get('cart_lines', 1):
+        return False
+    return True
+
+
+def _cache_key():
+    if request.method != 'GET' or request.endpoint not in CACHEABLE_ENDPOINTS:
+        return None
+    if not current_app.config['PAGE_CACHE_ENABLED'] or not _is_anonymous():
+        return None
+    args = tuple((name, request.args.get(name)) for name in CACHEABLE_ENDPOINTS[request.endpoint]
+                 if request.args.get(name))
+    return (request.endpoint, tuple(sorted((request.view_args or {}).items())), args)
+
+
+def _csrf_fingerprint():
+    raw = session.get(current_app.config['WTF_CSRF_FIELD_NAME'], '')
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8] if raw else '0'
+
+
+def _has_csrf_secret():
+    return current_app.config['WTF_CSRF_FIELD_NAME'] in session
+
+
+def _cached_response(entry):
+    """Build the response for a cache hit, or a 304 if the browser has it"""
+    body = entry['body']
+    if CSRF_PLACEHOLDER in body:
+        # Minting a token for a first-time visitor would store a session
+        # per anonymous page view; base.html fetches one when it's needed
+        token = generate_csrf() if _has_csrf_secret() else ''
+        body = body.replace(CSRF_PLACEHOLDER, token.encode('utf-8'))
+    # The page embeds this session's CSRF token, so the validator has to
+    # change with it or a 304 could revive a page with a dead token
+    etag = f"{entry['etag']}-{_csrf_fingerprint()}"
+
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype=entry['mimetype'])
+    response.set_etag(etag)
+    response.headers['X-Page-Cache'] = 'HIT'
+    return response
+
+
+def _set_cache_headers(response):
+    response.cache_control.private = True
+    response.cache_control.max_age = 0
+    response.cache_control.must_revalidate = True
+    response.vary.add('Cookie')
+
+
+def init_page_cache(app):
+    """Serve cacheable anonymous pages from memory"""
+
+    @app.before_request
+    def serve_cached_page():
+        key = _cache_key()
+        if key is None:
+            return None
+        entry = page_cache.get(key)
+        if entry is None:
+            g.page_cache_key = key
+            g.page_cache_had_csrf = _has_csrf_secret()
+            return None
+        response = _cached_response(entry)
+        _set_cache_headers(response)
+        return response
+
+    @app.after_request
+    def store_cached_page(response):
+        key = g.pop('page_cache_key', None)
+        if key is None:
+            return response
+        if response.status_code != 200 or response.direct_passthrough or not _is_anonymous():
+            return response
+
+        body = response.get_data()
+        token = g.get(app.config['WTF_CSRF_FIELD_NAME'])
+        if token:
+            body = body.replace(token.encode('utf-8'), CSRF_PLACEHOLDER)
+            if not g.pop('page_cache_had_csrf', True):
+                # Rendering minted this visitor's first token, serve the
+                # page like a hit instead so no session gets stored
+                session.pop(app.config['WTF_CSRF_FIELD_NAME'], None)
+                response.set_data(body.replace(CSRF_PLACEHOLDER, b''))
+        entry = page_cache.put(key, body, response.mimetype)
+
+        response.set_etag(f"{entry['etag']}-{_csrf_fingerprint()}")
+        response.headers['X-Page-Cache'] = 'MISS'
+        _set_cache_headers(response)
+        return response
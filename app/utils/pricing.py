@@ -0,0 +1,104 @@
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from flask import session
+
+
+CENT = Decimal('0.01')
+
+
+def to_cents(value):
+    """Exact integer cents for a price stored as float, str or Decimal"""
+    if value is None:
+        return 0
+    # str() first so 19.99 becomes Decimal('19.99'), not its binary expansion
+    return int((Decimal(str(value)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return (Decimal(cents) / 100).quantize(CENT)
+
+
+Coupon = namedtuple('Coupon', ['code', 'value', 'is_percentage'])
+
+
+class CartTotals(namedtuple('CartTotals', ['subtotal_cents', 'discount_cents', 'grand_total_cents', 'item_count'])):
+    """Cart totals in integer cents, with Decimal rand views for display"""
+
+    @property
+    def subtotal(self):
+        return from_cents(self.subtotal_cents)
+
+    @property
+    def discount(self):
+        return from_cents(self.discount_cents)
+
+    @property
+    def grand_total(self):
+        return from_cents(self.grand_total_cents)
+
+    def as_json(self):
+        return {
+            'cart_total': float(self.subtotal),
+            'discount': float(self.discount),
+            'grand_total': float(self.grand_total),
+            'item_count': self.item_count
+        }
+
+
+def session_coupon():
+    """The coupon applied to this session's cart, or None"""
+    code = session.get('coupon_code')
+    if not code:
+        return None
+    return Coupon(code, session.get('coupon_value', 0), session.get('coupon_is_percentage', False))
+
+
+def line_total_cents(item):
+    return to_cents(item.unit_price) * item.quantity
+
+
+def discount_cents(subtotal_cents, coupon):
+    """Coupon discount, never more than the subtotal"""
+    if coupon is None:
+        return 0
+    if coupon.is_percentage:
+        percent = Decimal(str(coupon.value or 0))
+        cents = (subtotal_cents * percent / 100).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+        cents = int(cents)
+    else:
+        cents = to_cents(coupon.value)
+    return max(0, min(cents, subtotal_cents))
+
+
+def price_items(items, coupon=None):
+    """Totals for cart items and an optional coupon"""
+    subtotal = sum(line_total_cents(item) for item in items)
+    discount = discount_cents(subtotal, coupon)
+    return CartTotals(
+        subtotal_cents=subtotal,
+        discount_cents=discount,
+        grand_total_cents=subtotal - discount,
+        item_count=sum(item.quantity or 0 for item in items)
+    )
+
+
+def _cart_version(cart, coupon):
+    return (tuple((item.product_id, item.quantity, item.unit_price) for item in cart.items), coupon)
+
+
+def cart_totals(cart, coupon=None):
+    """Totals for a cart, computed once per cart version.
+
+    The result is kept on the cart together with the items and coupon it
+    was computed from, and reused until either changes. With no coupon
+    given, the one stored in the session is used.
+    """
+    if coupon is None:
+        coupon = session_coupon()
+    version = _cart_version(cart, coupon)
+    cached = getattr(cart, '_totals', None)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    totals = price_items(cart.items, coupon)
+    cart._totals = (version, totals)
+    return totals
@@ -0,0 +1,122 @@
+import re
+from flask import current_app
+from datetime import datetime
+from sqlalchemy import bindparam, text, or_
+from app import db
+from app.models import Product
+from app.utils.catalog import cards_by_ids
+from app.utils.stock import buyable_stock
+
+
+SEARCH_LIMIT = 24
+
+# Relative weight of name, description and category matches
+NAME_WEIGHT, DESCRIPTION_WEIGHT, CATEGORY_WEIGHT = 10.0, 1.0, 5.0
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Stock other orders still hold on product, for the raw SQL backends
+# (the same sum as app.utils.stock.active_holds)
+HELD_SQL = (
+    "(SELECT coalesce(sum(quantity), 0) FROM stock_reservation "
+    "WHERE stock_reservation.product_id = product.id AND NOT stock_reservation.claimed "
+    "AND stock_reservation.expires_at > :now)"
+)
+
+# Refills the SQLite FTS5 table, see rebuild_search_index
+BACKFILL_SQL = (
+    "INSERT INTO product_fts (rowid, name, description, category) "
+    "SELECT id, name, coalesce(description, ''), coalesce(category, '') FROM product"
+)
+
+
+def _detect_backend():
+    """Which index the migrations created (d7f2a9c84e31), without touching the schema"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        exists = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'"
+        )).first()
+        if exists:
+            return 'fts5'
+    elif dialect == 'postgresql':
+        exists = db.session.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'product' AND column_name = 'search_vector'"
+        )).first()
+        if exists:
+            return 'tsvector'
+    current_app.logger.warning('Full-text search index missing, falling back to LIKE (run `flask db upgrade`)')
+    return 'like'
+
+
+def search_backend():
+    """'fts5', 'tsvector' or 'like', looked up once per process"""
+    backend = current_app.extensions.get('product_search')
+    if backend is None:
+        backend = current_app.extensions['product_search'] = _detect_backend()
+    return backend
+
+
+def rebuild_search_index():
+    """Re-index every product (only needed for the SQLite FTS5 table)"""
+    if search_backend() != 'fts5':
+        return
+    db.session.execute(text('DELETE FROM product_fts'))
+    db.session.execute(text(BACKFILL_SQL))
+
+
+def _tokens(query):
+    return TOKEN_RE.findall(query.lower())[:8]
+
+
+def _ranked_ids(tokens, limit):
+    backend = search_backend()
+
+    if backend == 'fts5':
+        # Every term must match, each as a prefix: "choc"* "cake"*
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        rows = db.session.execute(text(
+            'SELECT product.id FROM product_fts '
+            'JOIN product ON product.id = product_fts.rowid '
+            'WHERE product_fts MATCH :match AND product.available = 1 AND product.stock > ' + HELD_SQL + ' '
+            'ORDER BY bm25(product_fts, :name_weight, :description_weight, :category_weight) '
+            'LIMIT :limit'
+        ).bindparams(bindparam('now', type_=db.DateTime)), {
+            'match': match,
+            'now': datetime.utcnow(),
+            'name_weight': NAME_WEIGHT,
+            'description_weight': DESCRIPTION_WEIGHT,
+            'category_weight': CATEGORY_WEIGHT,
+            'limit': limit
+        })
+        return [row[0] for row in rows]
+
+    if backend == 'tsvector':
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        rows = db.session.execute(text(
+            "SELECT id FROM product "
+            "WHERE search_vector @@ to_tsquery('english', :tsquery) "
+            "AND available = true AND stock > " + HELD_SQL + " "
+            "ORDER BY ts_rank_cd(search_vector, to_tsquery('english', :tsquery)) DESC, id "
+            "LIMIT :limit"
+        ).bindparams(bindparam('now', type_=db.DateTime)), {'tsquery': tsquery, 'now': datetime.utcnow(), 'limit': limit})
+        return [row[0] for row in rows]
+
+    query = db.session.query(Product.id).filter(Product.available == True, buyable_stock() > 0)
+    for token in tokens:
+        pattern = f'%{token}%'
+        query = query.filter(or_(
+            Product.name.ilike(pattern),
+            Product.description.ilike(pattern),
+            Product.category.ilike(pattern)
+        ))
+    return [row[0] for row in query.order_by(Product.name).limit(limit)]
+
+
+def search_products(query, limit=SEARCH_LIMIT):
+    """Ranked product cards matching the query, best match first"""
+    tokens = _tokens(query or '')
+    if not tokens:
+        return []
+    return cards_by_ids(_ranked_ids(tokens, limit))
@@ -0,0 +1,175 @@
+import secrets
+from datetime import datetime, timedelta
+from flask import current_app, session as current_session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer, want_bytes
+from sqlalchemy import delete, select, update
+from werkzeug.datastructures import CallbackDict
+from app import db, session_store
+from app.models import ServerSession
+from app.utils.dialects import upsert_insert
+
+
+BACKENDS = ('sqlalchemy', 'cookie', 'filesystem')
+
+
+class SqlSession(CallbackDict, SessionMixin):
+    """Server-side session that remembers whether it was changed"""
+
+    def __init__(self, initial=None, sid=None, expiry=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expiry = expiry
+        self.new = new
+        self.modified = False
+        # Stored id this session is moving away from (regenerate_session)
+        self.replaces = None
+
+
+class SqlSessionInterface(SessionInterface):
+    """Sessions stored in the server_session table of the app database.
+
+    Only the signed session id goes in the cookie, so sessions work the
+    same on every instance behind the load balancer. Rows are written
+    when the session changes, otherwise at most once per
+    SESSION_TOUCH_INTERVAL seconds to push the idle expiry forward, so an
+    ordinary page view costs one primary-key read. Storage uses its own
+    connection and transaction, never the request's db.session.
+    """
+
+    serializer = TaggedJSONSerializer()
+    session_class = SqlSession
+    salt = 'flask-session'
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac')
+
+    def _new_session(self):
+        return self.session_class(sid=secrets.token_urlsafe(32), new=True)
+
+    def regenerate(self, session):
+        """Move the session to a fresh id, the old row goes when it's saved"""
+        if not session.new and session.replaces is None:
+            session.replaces = session.sid
+        session.sid = secrets.token_urlsafe(32)
+        session.modified = True
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self._new_session()
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return self._new_session()
+
+        table = ServerSession.__table__
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(table.c.data, table.c.expiry).where(table.c.id == sid)
+            ).first()
+        if row is None or row.expiry <= datetime.utcnow():
+            return self._new_session()
+        try:
+            data = self.serializer.loads(row.data)
+        except ValueError:
+            return self._new_session()
+        return self.session_class(data, sid=sid, expiry=row.expiry)
+
+    def _store(self, session, expiry):
+        table = ServerSession.__table__
+        values = {'data': self.serializer.dumps(dict(session)), 'expiry': expiry}
+        with db.engine.begin() as conn:
+            if session.replaces is not None:
+                conn.execute(delete(table).where(table.c.id == session.replaces))
+            if not session.modified:
+                conn.execute(update(table).where(table.c.id == session.sid).values(expiry=expiry))
+                return
+            stmt = upsert_insert(table)
+            if stmt is not None:
+                stmt = stmt.values(id=session.sid, **values)
+                conn.execute(stmt.on_conflict_do_update(index_elements=[table.c.id], set_=values))
+            elif conn.execute(update(table).where(table.c.id == session.sid).values(**values)).rowcount == 0:
+                conn.execute(table.insert().values(id=session.sid, **values))
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                with db.engine.begin() as conn:
+                    stored = session.replaces or session.sid
+                    conn.execute(delete(ServerSession.__table__).where(ServerSession.__table__.c.id == stored))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = datetime.utcnow()
+        lifetime = app.permanent_session_lifetime
+        touch = timedelta(seconds=app.config['SESSION_TOUCH_INTERVAL'])
+        stale = session.expiry is None or session.expiry - now < lifetime - touch
+        if not (session.modified or session.new or stale):
+            return
+
+        # Idle timeout for every session; the cookie itself only outlives
+        # the browser when the session is permanent
+        expiry = now + lifetime
+        self._store(session, expiry)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(want_bytes(session.sid)).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def init_sessions(app):
+    """Install the session backend named by SESSION_BACKEND"""
+    backend = app.config['SESSION_BACKEND']
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown SESSION_BACKEND {backend!r}, expected one of {BACKENDS}')
+    if backend == 'sqlalchemy':
+        app.session_interface = SqlSessionInterface()
+    elif backend == 'filesystem':
+        session_store.init_app(app)
+    # 'cookie' keeps Flask's signed cookie sessions, fine for the small
+    # cart/coupon payload when no server-side state is wanted
+
+
+def regenerate_session():
+    """Give the current session a new id, keeping its contents.
+
+    Call on login: an id planted in the visitor's browser beforehand
+    (session fixation) then no longer leads to the signed-in session.
+    Cookie sessions carry no id, their content is the session.
+    """
+    interface = current_app.session_interface
+    if isinstance(interface, SqlSessionInterface):
+        interface.regenerate(current_session)
+    elif current_app.config['SESSION_BACKEND'] == 'filesystem':
+        interface.cache.delete(interface.key_prefix + current_session.sid)
+        current_session.sid = interface._generate_sid()
+        current_session.modified = True
+
+
+def purge_expired_sessions(batch_size=1000, max_batches=None):
+    """Delete expired server_session rows in bounded batches, returns the count"""
+    table = ServerSession.__table__
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        with db.engine.begin() as conn:
+            expired = select(table.c.id).where(table.c.expiry <= datetime.utcnow()).limit(batch_size)
+            ids = conn.execute(expired).scalars().all()
+            if not ids:
+                break
+            deleted += conn.execute(delete(table).where(table.c.id.in_(ids))).rowcount
+        batches += 1
+    return deleted
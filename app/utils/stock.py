@@ -0,0 +1,310 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, delete, func, insert, select, update
+from app import db
+from app.models import Order, OrderItem, Product, StockReservation
+from app.utils.catalog_cache import invalidate_catalog_after_commit
+from app.utils.stripe_service import MIN_SESSION_LIFETIME
+
+
+LockedProduct = namedtuple('LockedProduct', ['id', 'name', 'stock', 'available'])
+
+StockProblem = namedtuple('StockProblem', ['product_id', 'name', 'requested', 'available'])
+
+# How long a hold outlives the order's Stripe session at the least
+HOLD_MARGIN = timedelta(minutes=4)
+
+
+def lock_products(product_ids):
+    """Lock the given product rows FOR UPDATE in one statement.
+
+    Rows are always locked in primary-key order, so two checkouts that
+    share products queue behind each other instead of deadlocking.
+    Returns {product_id: LockedProduct}.
+    """
+    if not product_ids:
+        return {}
+    rows = db.session.query(
+        Product.id, Product.name, Product.stock, Product.available
+    ).filter(Product.id.in_(sorted(set(product_ids)))).order_by(Product.id).with_for_update().all()
+    return {row.id: LockedProduct._make(row) for row in rows}
+
+
+def held_quantities(product_ids):
+    """{product_id: quantity} held by unexpired, unclaimed reservations.
+
+    Answered from the (product_id, claimed, expires_at, quantity) index alone.
+    """
+    if not product_ids:
+        return {}
+    rows = db.session.query(
+        StockReservation.product_id, func.sum(StockReservation.quantity)
+    ).filter(
+        StockReservation.product_id.in_(product_ids),
+        StockReservation.claimed == False,
+        StockReservation.expires_at > datetime.utcnow()
+    ).group_by(StockReservation.product_id).all()
+    return {product_id: int(held) for product_id, held in rows}
+
+
+def available_stock(product_ids):
+    """{product_id: stock minus active holds} in two indexed queries"""
+    stock = dict(db.session.query(Product.id, Product.stock).filter(Product.id.in_(product_ids)).all())
+    held = held_quantities(list(stock))
+    return {product_id: max(0, count - held.get(product_id, 0)) for product_id, count in stock.items()}
+
+
+def check_stock(locked, quantities, held=None):
+    """Lines from {product_id: quantity} that the locked rows can't cover.
+
+    held is {product_id: quantity} reserved by other orders, which is
+    not available to this one.
+    """
+    held = held or {}
+    problems = []
+    for product_id, quantity in sorted(quantities.items()):
+        product = locked.get(product_id)
+        if product is None or not product.available:
+            problems.append(StockProblem(product_id, product.name if product else None, quantity, 0))
+            continue
+        available = max(0, product.stock - held.get(product_id, 0))
+        if available < quantity:
+            problems.append(StockProblem(product_id, product.name, quantity, available))
+    return problems
+
+
+def _stock_problems(quantities, covered):
+    """StockProblems for the lines of quantities not in covered"""
+    missing = sorted(set(quantities) - set(covered))
+    if not missing:
+        return []
+    current = {row.id: row for row in db.session.query(
+        Product.id, Product.name, Product.stock, Product.available
+    ).filter(Product.id.in_(missing))}
+    held = held_quantities(missing)
+    problems = []
+    for product_id in missing:
+        product = current.get(product_id)
+        available = product.stock - held.get(product_id, 0) if product and product.available else 0
+        problems.append(StockProblem(product_id, product.name if product else None,
+                                     quantities[product_id], max(0, available)))
+    return problems
+
+
+def decrement_stock(quantities):
+    """Take {product_id: quantity} off stock in one UPDATE ... CASE statement.
+
+    Lines whose stock can't cover them are left alone rather than going
+    negative, and returned as StockProblems.
+    """
+    if not quantities:
+        return []
+    requested = case(quantities, value=Product.id)
+    rows = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(quantities), Product.stock >= requested)
+        .values(stock=Product.stock - requested)
+        .returning(Product.id, Product.stock)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if rows:
+        invalidate_catalog_after_commit()
+    return _stock_problems(quantities, [row.id for row in rows])
+
+
+def restore_stock(quantities):
+    """Put {product_id: quantity} back on stock in one UPDATE ... CASE statement"""
+    if not quantities:
+        return 0
+    restored = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(quantities))
+        .values(stock=Product.stock + case(quantities, value=Product.id))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if restored:
+        invalidate_catalog_after_commit()
+    return restored
+
+
+def active_holds():
+    """Correlated SUM of the unclaimed, unexpired holds on Product's row"""
+    return select(func.coalesce(func.sum(StockReservation.quantity), 0)).where(
+        StockReservation.product_id == Product.id,
+        StockReservation.claimed == False,
+        StockReservation.expires_at > datetime.utcnow()
+    ).scalar_subquery()
+
+
+def buyable_stock():
+    """Product.stock net of active holds, as a column expression for catalog queries"""
+    return Product.stock - active_holds()
+
+
+def claim_stock(quantities):
+    """Take flash-sale {product_id: quantity} off stock, all or nothing.
+
+    A single UPDATE ... SET stock = stock - q WHERE stock - held >= q,
+    where held is whatever regular checkouts still hold on the product
+    (say from before it went on flash sale). The rows are locked first:
+    under READ COMMITTED the UPDATE would otherwise measure held against
+    a snapshot taken before a regular checkout, already holding the row
+    lock, committed its reservation. Buyers queue on that lock either
+    way, the UPDATE takes it too. Returns the StockProblems when any line
+    can't be covered, the caller then rolls back the partial claim.
+    """
+    if not quantities:
+        return []
+    lock_products(quantities)
+    requested = case(quantities, value=Product.id)
+    rows = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(quantities), Product.available == True,
+               Product.stock - active_holds() >= requested)
+        .values(stock=Product.stock - requested)
+        .returning(Product.id, Product.stock)
+        .execution_options(synchronize_session=False)
+    ).all()
+    problems = _stock_problems(quantities, [row.id for row in rows])
+    if problems:
+        return problems
+    invalidate_catalog_after_commit()
+    return []
+
+
+def _order_quantities(order_id):
+    rows = db.session.query(OrderItem.product_id, func.sum(OrderItem.quantity)).filter(
+        OrderItem.order_id == order_id
+    ).group_by(OrderItem.product_id).all()
+    return {product_id: int(quantity) for product_id, quantity in rows}
+
+
+def hold_expiry():
+    """When a reservation made now runs out, always after its Stripe session closes"""
+    session_lifetime = max(timedelta(minutes=current_app.config['CHECKOUT_SESSION_MINUTES']), MIN_SESSION_LIFETIME)
+    hold = max(timedelta(minutes=current_app.config['STOCK_HOLD_MINUTES']), session_lifetime + HOLD_MARGIN)
+    return datetime.utcnow() + hold
+
+
+def _claimed_quantities(order_id):
+    rows = db.session.query(StockReservation.product_id, func.sum(StockReservation.quantity)).filter(
+        StockReservation.order_id == order_id, StockReservation.claimed == True
+    ).group_by(StockReservation.product_id).all()
+    return {product_id: int(quantity) for product_id, quantity in rows}
+
+
+def reserve_stock(order_id, quantities, expires_at, claimed=False):
+    """Hold {product_id: quantity} for an unpaid order until expires_at.
+
+    Call with the product rows locked (lock_products) and checked against
+    held_quantities, so two checkouts can't both claim the last cake.
+    Stock itself is only taken when the order is paid. With claimed=True
+    the rows record a flash-sale claim_stock() instead, which already
+    took the stock and gets it back if the order expires unpaid.
+    """
+    if quantities:
+        db.session.execute(insert(StockReservation), [{
+            'order_id': order_id,
+            'product_id': product_id,
+            'quantity': quantity,
+            'claimed': claimed,
+            'expires_at': expires_at,
+            'created_at': datetime.utcnow()
+        } for product_id, quantity in sorted(quantities.items())])
+        invalidate_catalog_after_commit()  # less left to buy
+
+
+def confirm_order_stock(order):
+    """Turn a paid order's holds into a real stock decrement, once.
+
+    Doesn't commit; the caller commits together with the status change.
+    """
+    if order.stock_deducted:
+        return
+    # Flash-sale lines were taken off stock when they were claimed
+    claimed = _claimed_quantities(order.id)
+    quantities = {product_id: quantity - claimed.get(product_id, 0)
+                  for product_id, quantity in _order_quantities(order.id).items()
+                  if quantity > claimed.get(product_id, 0)}
+    lock_products(quantities)
+    db.session.execute(delete(StockReservation).where(StockReservation.order_id == order.id))
+    for problem in decrement_stock(quantities):
+        # The customer has paid, so the order goes through; someone has to
+        # find the missing cakes or refund them
+        current_app.logger.error(f'Order #{order.id} is paid for {problem.requested} x {problem.name} '
+                                 f'but only {problem.available} are in stock, stock left unchanged')
+    order.stock_deducted = True
+
+
+def release_order_stock(order):
+    """Give back whatever a cancelled or deleted order still holds.
+
+    Drops its reservations and puts back whatever was already taken off
+    stock: every item once the order was paid, otherwise its flash-sale
+    claims. Safe to call twice. Doesn't commit.
+    """
+    quantities = _order_quantities(order.id) if order.stock_deducted else _claimed_quantities(order.id)
+    if db.session.execute(delete(StockReservation).where(StockReservation.order_id == order.id)).rowcount:
+        invalidate_catalog_after_commit()  # more left to buy
+    order.stock_deducted = False
+    if quantities:
+        lock_products(quantities)
+        restore_stock(quantities)
+
+
+def release_expired_holds(batch_size=None, max_batches=None):
+    """Drop expired holds in bounded batches, one commit per batch.
+
+    Orders whose holds ran out without a payment are marked Cancelled /
+    Expired, and their flash-sale claims go back on stock. Orders with a
+    Stripe session are checked with Stripe first (session_expired_unpaid):
+    one paid after all is confirmed instead, one Stripe can't vouch for
+    keeps its holds until a later run. Returns the number of orders released.
+    """
+    from app.utils.stripe_events import session_expired_unpaid
+    
+    batch_size = batch_size or current_app.config['STOCK_HOLD_BATCH_SIZE']
+    released = batches = 0
+    kept = set()  # orders left for a later run, skipped for the rest of this one
+    while max_batches is None or batches < max_batches:
+        now = datetime.utcnow()
+        order_ids = db.session.execute(
+            select(StockReservation.order_id).distinct()
+            .where(StockReservation.expires_at <= now, StockReservation.order_id.notin_(kept))
+            .limit(batch_size)
+        ).scalars().all()
+        if not order_ids:
+            break
+        for order in Order.query.filter(
+            Order.id.in_(order_ids), Order.payment_status == 'Pending',
+            Order.stock_deducted == False, Order.stripe_session_id.isnot(None)
+        ):
+            if not session_expired_unpaid(order):
+                kept.add(order.id)
+        order_ids = [order_id for order_id in order_ids if order_id not in kept]
+        if order_ids:
+            claimed = db.session.query(StockReservation.product_id, func.sum(StockReservation.quantity)).join(Order).filter(
+                StockReservation.order_id.in_(order_ids),
+                StockReservation.expires_at <= now,
+                StockReservation.claimed == True,
+                Order.payment_status == 'Pending',
+                Order.stock_deducted == False
+            ).group_by(StockReservation.product_id).all()
+            db.session.execute(
+                delete(StockReservation)
+                .where(StockReservation.order_id.in_(order_ids), StockReservation.expires_at <= now)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.execute(
+                update(Order)
+                .where(Order.id.in_(order_ids), Order.payment_status == 'Pending', Order.stock_deducted == False)
+                .values(status='Cancelled', payment_status='Expired')
+                .execution_options(synchronize_session=False)
+            )
+            if claimed:
+                restore_stock({product_id: int(quantity) for product_id, quantity in claimed})
+        db.session.commit()
+        released += len(order_ids)
+        batches += 1
+    return released
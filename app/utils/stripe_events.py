@@ -0,0 +1,195 @@
+import json
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+import stripe
+from app import db
+from app.models import Order, Payment, StripeEvent
+from app.utils.dialects import upsert_insert
+from app.utils.pricing import from_cents
+from app.utils.stock import confirm_order_stock, release_order_stock
+
+
+# Set by the webhook so the worker applies a new event without waiting a full poll
+_wakeup = threading.Event()
+
+
+def record_stripe_event(event_id, event_type, payload):
+    """Append a verified event to the queue, a no-op if it was seen before.
+
+    Returns True when the event is new.
+    """
+    values = {'event_id': event_id, 'type': event_type, 'payload': payload, 'received_at': datetime.utcnow()}
+    stmt = upsert_insert(StripeEvent)
+    if stmt is not None:
+        stmt = stmt.values(**values).on_conflict_do_nothing(index_elements=[StripeEvent.event_id])
+        added = db.session.execute(stmt).rowcount > 0
+        db.session.commit()
+        return added
+    try:
+        db.session.execute(StripeEvent.__table__.insert().values(**values))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def wake_event_worker():
+    _wakeup.set()
+
+
+def mark_order_paid(order, payment_intent_id, amount):
+    """Move a Pending order to Paid once, take its stock and log the Payment.
+
+    The status flip is a conditional UPDATE, so the webhook worker and the
+    success page fallback can't both record the payment. Doesn't commit.
+    """
+    paid = db.session.execute(
+        update(Order)
+        .where(Order.id == order.id, Order.payment_status == 'Pending')
+        .values(payment_status='Paid', status='Baking')
+    ).rowcount
+    if not paid:
+        if order.payment_status != 'Paid':
+            current_app.logger.error(f'Payment {payment_intent_id} arrived for order #{order.id} '
+                                     f'which is {order.payment_status}, refund it manually')
+        return False
+    confirm_order_stock(order)
+    db.session.add(Payment(order_id=order.id, stripe_payment_intent_id=payment_intent_id or '', amount=float(amount)))
+    return True
+
+
+def cancel_unpaid_order(order, payment_status):
+    """Cancel a still-Pending order whose Stripe session expired or failed. Doesn't commit."""
+    if order.payment_status != 'Pending':
+        return False
+    release_order_stock(order)
+    order.status = 'Cancelled'
+    order.payment_status = payment_status
+    return True
+
+
+def apply_checkout_session(order, checkout_session, event_type='checkout.session.completed'):
+    """Bring an order in line with a Stripe Checkout session object"""
+    if event_type in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
+        if checkout_session['payment_status'] in ('paid', 'no_payment_required'):
+            return mark_order_paid(order, checkout_session.get('payment_intent'),
+                                   from_cents(checkout_session.get('amount_total') or 0))
+    elif event_type == 'checkout.session.async_payment_failed':
+        return cancel_unpaid_order(order, 'Failed')
+    elif event_type == 'checkout.session.expired':
+        return cancel_unpaid_order(order, 'Expired')
+    return False
+
+
+def _event_order_id(payload):
+    checkout_session = payload['data']['object']
+    order_id = (checkout_session.get('metadata') or {}).get('order_id')
+    return int(order_id) if order_id else None
+
+
+def process_stripe_events(batch_size=None, max_batches=None):
+    """Apply queued webhook events to orders in batches, one commit per batch.
+
+    Each batch's orders are loaded in one query. A failing event is rolled
+    back on its own savepoint and retried on later runs, once per run, up
+    to STRIPE_EVENT_MAX_ATTEMPTS times. Returns the number of events processed.
+    """
+    batch_size = batch_size or current_app.config['STRIPE_EVENT_BATCH_SIZE']
+    max_attempts = current_app.config['STRIPE_EVENT_MAX_ATTEMPTS']
+    handled = batches = 0
+    last_id = 0  # events up to here were tried this run, failed ones wait for the next
+    while max_batches is None or batches < max_batches:
+        events = StripeEvent.query.filter(
+            StripeEvent.processed_at.is_(None), StripeEvent.attempts < max_attempts, StripeEvent.id > last_id
+        ).order_by(StripeEvent.id).limit(batch_size).with_for_update(skip_locked=True).all()
+        if not events:
+            break
+
+        payloads = {event.id: json.loads(event.payload) for event in events}
+        order_ids = {_event_order_id(payload) for payload in payloads.values()
+                     if payload['type'].startswith('checkout.session.')}
+        orders = {order.id: order for order in Order.query.filter(Order.id.in_(order_ids - {None}))}
+
+        for event in events:
+            payload = payloads[event.id]
+            try:
+                with db.session.begin_nested():
+                    if event.type.startswith('checkout.session.'):
+                        order = orders.get(_event_order_id(payload))
+                        if order is None:
+                            current_app.logger.warning(f'Stripe event {event.event_id} has no matching order')
+                        else:
+                            apply_checkout_session(order, payload['data']['object'], event.type)
+                event.processed_at = datetime.utcnow()
+                handled += 1
+            except Exception as e:
+                event.attempts += 1
+                event.last_error = str(e)
+                current_app.logger.error(f'Stripe event {event.event_id} failed: {str(e)}')
+        last_id = events[-1].id
+        db.session.commit()
+        batches += 1
+    return handled
+
+
+def sync_checkout_session(order):
+    """Ask Stripe directly whether a Pending order was paid.
+
+    For the success page when no webhook secret is configured, so the
+    order no longer trusts whoever opens the success URL. Commits.
+    """
+    if order.payment_status != 'Pending' or not order.stripe_session_id:
+        return False
+    checkout_session = stripe.checkout.Session.retrieve(order.stripe_session_id)
+    if str((checkout_session.get('metadata') or {}).get('order_id')) != str(order.id):
+        return False
+    changed = apply_checkout_session(order, checkout_session)
+    db.session.commit()
+    return changed
+
+
+def session_expired_unpaid(order):
+    """Ask Stripe about an order whose stock holds ran out, before it is cancelled.
+
+    A customer may have paid at the last minute with the webhook late or
+    not configured, so a paid session records the payment here instead.
+    Returns True only when the session is closed and unpaid, or Stripe
+    doesn't know it; False leaves the order for a later run. Doesn't commit.
+    """
+    try:
+        checkout_session = stripe.checkout.Session.retrieve(order.stripe_session_id)
+    except stripe.error.InvalidRequestError:
+        return True
+    except stripe.error.StripeError as e:
+        current_app.logger.warning(f'Could not check Stripe session of order #{order.id}: {str(e)}')
+        return False
+    if checkout_session['status'] == 'complete':
+        apply_checkout_session(order, checkout_session)
+        return False
+    return checkout_session['status'] == 'expired'
+
+
+def start_stripe_event_worker(app):
+    """Process queued Stripe events whenever the webhook wakes us, or every STRIPE_EVENT_POLL_INTERVAL seconds"""
+    interval = app.config['STRIPE_EVENT_POLL_INTERVAL']
+
+    def run():
+        while True:
+            _wakeup.wait(interval)
+            _wakeup.clear()
+            with app.app_context():
+                try:
+                    process_stripe_events()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f'Stripe event worker failed: {str(e)}')
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='stripe-events', daemon=True)
+    thread.start()
+    return thread
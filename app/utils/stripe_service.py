@@ -1,9 +1,22 @@
 import stripe
+from datetime import datetime, timedelta, timezone
 from flask import current_app, url_for
 
 
-def create_checkout_session(order_id, amount, customer_email=None, success_url=None, cancel_url=None):
-    """Create Stripe checkout session"""
+# Stripe refuses sessions that expire less than 30 minutes after they are
+# created, the extra minute covers clock skew and the request itself
+MIN_SESSION_LIFETIME = timedelta(minutes=31)
+
+
+def checkout_session_expiry():
+    """expires_at for a Checkout session created now, never below Stripe's minimum"""
+    lifetime = timedelta(minutes=current_app.config['CHECKOUT_SESSION_MINUTES'])
+    return datetime.utcnow() + max(lifetime, MIN_SESSION_LIFETIME)
+
+
+def create_checkout_session(order_id, amount, customer_email=None, success_url=None, cancel_url=None, expires_at=None,
+                            idempotency_key=None):
+    """Create Stripe checkout session; retries with the same idempotency_key return the same session"""
     try:
         # Round to avoid floating point issues
         amount_cents = int(round(amount * 100))
@@ -37,7 +50,11 @@ def create_checkout_session(order_id, amount, customer_email=None, success_url=N
         if customer_email:
             session_data['customer_email'] = customer_email
         
-        session = stripe.checkout.Session.create(**session_data)
+        # Close the session before the order's stock holds run out
+        if expires_at:
+            session_data['expires_at'] = int(expires_at.replace(tzinfo=timezone.utc).timestamp())
+        
+        session = stripe.checkout.Session.create(idempotency_key=idempotency_key, **session_data)
         return session
     except stripe.error.StripeError as e:
         current_app.logger.error(f'Stripe error: {str(e)}')
@@ -0,0 +1,146 @@
+import bisect
+import threading
+from app import db
+from app.models import Product
+from app.utils.catalog_cache import PRODUCTS, catalog_cache, get_version
+
+
+SUGGEST_LIMIT = 8
+MAX_SUGGEST_LIMIT = 20
+
+
+def _word_suffixes(name):
+    """'Lemon Drizzle Cake' -> 'lemon drizzle cake', 'drizzle cake', 'cake'"""
+    text = ' '.join(name.lower().split())
+    suffixes = [text]
+    for index, char in enumerate(text):
+        if char == ' ':
+            suffixes.append(text[index + 1:])
+    return suffixes
+
+
+class TypeaheadIndex:
+    """Sorted-array prefix index over available product names and categories.
+
+    Each product contributes one key per word of its name, so typing any
+    word finds it. Lookups are two bisections on an in-memory list, no
+    database access. Writers replace the lists wholesale under a lock, so
+    readers always see a consistent snapshot without locking.
+    """
+
+    def __init__(self):
+        self._keys = []       # sorted (key, product_id)
+        self._products = {}   # product_id -> (name, category)
+        self._categories = {} # category -> number of listed products
+        self._lock = threading.Lock()
+        self.version = None          # products version the index was built at
+        self.catalog_version = None  # catalog version it was last checked at
+
+    def rebuild(self, rows, version):
+        """Replace the whole index from (id, name, category) rows"""
+        keys, products, categories = [], {}, {}
+        for product_id, name, category in rows:
+            products[product_id] = (name, category)
+            keys.extend((suffix, product_id) for suffix in _word_suffixes(name))
+            if category:
+                categories[category] = categories.get(category, 0) + 1
+        keys.sort()
+        with self._lock:
+            self._keys, self._products, self._categories = keys, products, categories
+            self.version = version
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def upsert(self, product_id, name, category):
+        with self._lock:
+            self._remove(product_id)
+            keys = list(self._keys)
+            for suffix in _word_suffixes(name):
+                bisect.insort(keys, (suffix, product_id))
+            products = dict(self._products)
+            products[product_id] = (name, category)
+            categories = dict(self._categories)
+            if category:
+                categories[category] = categories.get(category, 0) + 1
+            self._keys, self._products, self._categories = keys, products, categories
+
+    def _remove(self, product_id):
+        entry = self._products.get(product_id)
+        if entry is None:
+            return
+        name, category = entry
+        drop = {(suffix, product_id) for suffix in _word_suffixes(name)}
+        products = dict(self._products)
+        del products[product_id]
+        categories = dict(self._categories)
+        if category in categories:
+            categories[category] -= 1
+            if categories[category] <= 0:
+                del categories[category]
+        self._keys = [key for key in self._keys if key not in drop]
+        self._products, self._categories = products, categories
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """Matching categories and up to `limit` products for a prefix"""
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return [], []
+        keys, products = self._keys, self._products
+
+        matches = []
+        seen = set()
+        start = bisect.bisect_left(keys, (prefix,))
+        for key, product_id in keys[start:]:
+            if not key.startswith(prefix):
+                break
+            if product_id in seen:
+                continue
+            seen.add(product_id)
+            matches.append((product_id, products[product_id][0]))
+            if len(matches) >= limit:
+                break
+
+        categories = sorted(c for c in self._categories if c.lower().startswith(prefix))
+        return categories, matches
+
+    def note_local_write(self, version, catalog_version):
+        """Keep an incrementally updated index current after our own bump"""
+        with self._lock:
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+                self.catalog_version = catalog_version
+
+
+typeahead = TypeaheadIndex()
+
+
+def _listed_rows():
+    return db.session.query(Product.id, Product.name, Product.category).filter(Product.available == True).all()
+
+
+def current_index():
+    """The worker's typeahead index, rebuilt only when products changed.
+
+    Names and categories don't depend on stock, so a catalog bump from a
+    sale costs one read of the products version instead of a rebuild.
+    """
+    catalog_version = catalog_cache.current_version()
+    if typeahead.catalog_version != catalog_version:
+        version = get_version(PRODUCTS)
+        if typeahead.version != version:
+            typeahead.rebuild(_listed_rows(), version)
+        typeahead.catalog_version = catalog_version
+    return typeahead
+
+
+def product_changed(product=None, product_id=None):
+    """Apply a committed product change to this worker's index"""
+    if typeahead.version is None:
+        return  # not built yet, the first lookup will build it
+    if product is not None and product.available:
+        typeahead.upsert(product.id, product.name, product.category)
+    else:
+        typeahead.remove(product.id if product is not None else product_id)
+    typeahead.note_local_write(get_version(PRODUCTS), catalog_cache.current_version())
@@ -25,6 +25,11 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Session configuration
+    # 'sqlalchemy' (server_session table, works across instances), 'cookie'
+    # (Flask's signed cookie) or 'filesystem' (Flask-Session, single instance)
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlalchemy')
+    SESSION_TOUCH_INTERVAL = 60  # seconds between idle-expiry refreshes of an unchanged session
+    SESSION_PURGE_BATCH_SIZE = 1000
     SESSION_TYPE = 'filesystem'
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
@@ -38,11 +43,66 @@ class Config:
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
     STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+    # Webhook events are queued in stripe_event and applied in batches by an
+    # in-process worker (0 disables it, run `flask process-stripe-events`)
+    STRIPE_EVENT_POLL_INTERVAL = float(os.environ.get('STRIPE_EVENT_POLL_INTERVAL', 5))
+    STRIPE_EVENT_BATCH_SIZE = int(os.environ.get('STRIPE_EVENT_BATCH_SIZE', 100))
+    STRIPE_EVENT_MAX_ATTEMPTS = int(os.environ.get('STRIPE_EVENT_MAX_ATTEMPTS', 5))
     
     # Upload configuration
     UPLOAD_FOLDER = 'app/static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
     
+    # Product image storage (content-addressed blobs)
+    IMAGE_STORE_BACKEND = os.environ.get('IMAGE_STORE_BACKEND', 'local')
+    IMAGE_STORE_PATH = os.environ.get('IMAGE_STORE_PATH', 'app/static/uploads/images')
+    B64_INLINE_MAX_BYTES = 2 * 1024  # cap for the b64encode template filter
+    
+    # Process-local catalog cache, invalidated through the cache_version table
+    CATALOG_CACHE_ENABLED = os.environ.get('CATALOG_CACHE_ENABLED', 'true').lower() == 'true'
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 300))
+    CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 1000))
+    CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', 2))
+    
+    # Rendered product card fragments, LRU bounded by total markup size (0 disables)
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 4 * 1024 * 1024))
+    
+    # Whole-page cache for anonymous visitors (see app/utils/page_cache.py)
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', 'true').lower() == 'true'
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 500))
+    
+    # Abandoned cart cleanup (flask sweep-carts, or in-process when the interval is > 0)
+    CART_RETENTION_DAYS = int(os.environ.get('CART_RETENTION_DAYS', 14))
+    CART_GC_BATCH_SIZE = int(os.environ.get('CART_GC_BATCH_SIZE', 500))
+    CART_GC_INTERVAL = int(os.environ.get('CART_GC_INTERVAL', 0))
+    
+    # Stock held for unpaid orders (app/utils/stock.py). Holds must outlive
+    # the Stripe Checkout session, which is kept open for at least 31 min
+    # (Stripe's minimum plus a margin, see stripe_service.py)
+    CHECKOUT_SESSION_MINUTES = int(os.environ.get('CHECKOUT_SESSION_MINUTES', 31))
+    STOCK_HOLD_MINUTES = int(os.environ.get('STOCK_HOLD_MINUTES', 35))
+    STOCK_HOLD_BATCH_SIZE = int(os.environ.get('STOCK_HOLD_BATCH_SIZE', 200))
+    # Checkout outbox: Stripe attempts while placing an order, how long an
+    # unsent entry may sit before the relay settles it, and the relay's
+    # first backoff after a Stripe error (doubling on each retry)
+    CHECKOUT_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('CHECKOUT_OUTBOX_MAX_ATTEMPTS', 3))
+    CHECKOUT_OUTBOX_STALE_SECONDS = int(os.environ.get('CHECKOUT_OUTBOX_STALE_SECONDS', 600))
+    CHECKOUT_OUTBOX_RETRY_SECONDS = int(os.environ.get('CHECKOUT_OUTBOX_RETRY_SECONDS', 30))
+    # Place-order idempotency keys, kept as long as Stripe keeps its own,
+    # and how long one may stay 'processing' before its request is taken
+    # for dead (longer than placing an order can take)
+    IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    IDEMPOTENCY_PROCESSING_SECONDS = int(os.environ.get('IDEMPOTENCY_PROCESSING_SECONDS', 300))
+    # Expired holds, the outbox relay and expired keys and sessions
+    # (app/utils/maintenance.py): in-process every MAINTENANCE_INTERVAL
+    # seconds, or 0 to run `flask run-maintenance` from cron instead
+    MAINTENANCE_INTERVAL = int(os.environ.get('MAINTENANCE_INTERVAL', 60))
+    
+    # Homepage featured products, sampled from a cached candidate pool
+    FEATURED_COUNT = 3
+    FEATURED_SALES_WINDOW_DAYS = int(os.environ.get('FEATURED_SALES_WINDOW_DAYS', 30))
+    
     # Security
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None
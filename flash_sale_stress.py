@@ -0,0 +1,177 @@
+# flash_sale_stress.py
+"""Concurrency harness for flash-sale checkout: many buyers, one hot product.
+
+Starts --buyers threads that all claim --quantity of a fresh flash-sale
+product with --stock units at the same moment, then checks that exactly
+the stock on hand was sold and never more.
+
+With --regular, that many regular checkouts run alongside the claims,
+each locking the product and holding --quantity units for an unpaid
+order the way checkout does for products that are not on flash sale.
+Claims must then leave at least the held units on the shelf.
+
+    python flash_sale_stress.py --buyers 300 --stock 40
+    python flash_sale_stress.py --buyers 200 --regular 100 --stock 40
+    DATABASE_URL=postgresql://... python flash_sale_stress.py --buyers 500 --regular 200
+
+Without DATABASE_URL it runs against a throwaway SQLite file. The test
+product, user and orders are deleted again afterwards. Exits 1 if
+anything was oversold.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Add the current directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'flash-sale-stress')
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--buyers', type=int, default=200)
+parser.add_argument('--stock', type=int, default=25)
+parser.add_argument('--quantity', type=int, default=1, help='Units each buyer asks for')
+parser.add_argument('--regular', type=int, default=0, help='Regular checkouts holding stock alongside the claims')
+args = parser.parse_args()
+
+scratch = None
+if not os.environ.get('DATABASE_URL'):
+    scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    os.environ['DATABASE_URL'] = f'sqlite:///{scratch.name}'
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from app import create_app, db
+from app.models import Product, User, Order, StockReservation
+from app.utils.stock import claim_stock, lock_products, check_stock, held_quantities, reserve_stock, hold_expiry
+from config import Config
+
+
+class StressConfig(Config):
+    SESSION_BACKEND = 'cookie'
+    PAGE_CACHE_ENABLED = False
+    if scratch:
+        # SQLite serializes writers, let them queue instead of failing
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30, 'check_same_thread': False}}
+
+
+app = create_app(StressConfig)
+
+with app.app_context():
+    if scratch:
+        # SQLite ignores FOR UPDATE and pysqlite only opens a transaction
+        # at the first write, so lock_products() would guard nothing. Take
+        # the database write lock when each transaction begins instead.
+        @event.listens_for(db.engine, 'connect')
+        def _autocommit_driver(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(db.engine, 'begin')
+        def _begin_immediate(conn):
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+    product = Product(name='Flash sale stress test', price=1, stock=args.stock, available=True, flash_sale=True)
+    user = User(email='flash-sale-stress@example.com', password_hash='-', first_name='Flash',
+                last_name='Sale', phone_number='0000000000', id_number='0000000000000')
+    db.session.add_all([product, user])
+    db.session.commit()
+    product_id = product.id
+    user_id = user.id
+
+results = {'sold': 0, 'rejected': 0, 'errors': 0, 'held': 0, 'refused': 0, 'hold_errors': 0}
+latencies = []
+lock = threading.Lock()
+start = threading.Barrier(args.buyers + args.regular)
+
+
+def buyer():
+    with app.app_context():
+        start.wait()
+        began = time.perf_counter()
+        try:
+            problems = claim_stock({product_id: args.quantity})
+            if problems:
+                db.session.rollback()
+                outcome = 'rejected'
+            else:
+                db.session.commit()
+                outcome = 'sold'
+        except OperationalError as e:
+            db.session.rollback()
+            outcome = 'errors'
+            print(f'Buyer failed: {e.orig}')
+        finally:
+            db.session.remove()
+        with lock:
+            results[outcome] += 1
+            latencies.append(time.perf_counter() - began)
+
+
+def regular_checkout():
+    """Hold stock for an unpaid order, as checkout does for regular lines"""
+    quantities = {product_id: args.quantity}
+    with app.app_context():
+        start.wait()
+        try:
+            problems = check_stock(lock_products(quantities), quantities, held_quantities([product_id]))
+            if problems:
+                db.session.rollback()
+                outcome = 'refused'
+            else:
+                order = Order(user_id=user_id, total_amount=args.quantity, delivery_address='-')
+                db.session.add(order)
+                db.session.flush()
+                reserve_stock(order.id, quantities, hold_expiry())
+                db.session.commit()
+                outcome = 'held'
+        except OperationalError as e:
+            db.session.rollback()
+            outcome = 'hold_errors'
+            print(f'Regular checkout failed: {e.orig}')
+        finally:
+            db.session.remove()
+        with lock:
+            results[outcome] += 1
+
+
+threads = [threading.Thread(target=buyer) for _ in range(args.buyers)]
+threads += [threading.Thread(target=regular_checkout) for _ in range(args.regular)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+with app.app_context():
+    final_stock = db.session.get(Product, product_id).stock
+    final_held = held_quantities([product_id]).get(product_id, 0)
+    StockReservation.query.filter_by(product_id=product_id).delete()
+    Order.query.filter_by(user_id=user_id).delete()
+    User.query.filter_by(id=user_id).delete()
+    Product.query.filter_by(id=product_id).delete()
+    db.session.commit()
+
+if scratch:
+    os.unlink(scratch.name)
+
+latencies.sort()
+expected_sold = min(args.buyers, args.stock // args.quantity)
+print(f"Buyers: {args.buyers}, regular checkouts: {args.regular}, stock: {args.stock}, quantity each: {args.quantity}")
+print(f"Sold: {results['sold']}, rejected: {results['rejected']}, errors: {results['errors']}")
+if args.regular:
+    print(f"Held: {results['held']}, refused: {results['refused']}, errors: {results['hold_errors']}")
+print(f"Final stock: {final_stock}, still held: {final_held}")
+print(f"Latency p50: {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+      f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms")
+
+oversold = (results['sold'] * args.quantity > args.stock
+            or final_stock != args.stock - results['sold'] * args.quantity
+            or final_held != results['held'] * args.quantity
+            or final_stock - final_held < 0)
+if oversold:
+    print("❌ Oversold!")
+    sys.exit(1)
+if not args.regular and results['sold'] + results['errors'] < expected_sold:
+    print(f"⚠ Only {results['sold']} of {expected_sold} possible sales went through")
+print("✅ No overselling")
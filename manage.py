@@ -5,6 +5,7 @@ import click
 from app.models import User, Product, Coupon
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
+from sqlalchemy import text, inspect
 import os
 
 app = create_app()
@@ -133,5 +134,145 @@ def create_admin_command(email, password):
     db.session.commit()
     print(f"Admin user {email} created successfully")
 
+@app.cli.command("migrate-images")
+@click.option('--batch-size', default=50, help='Number of products to move per batch')
+def migrate_images_command(batch_size):
+    """Move legacy product.image_bytes blobs into the image store"""
+    from app.utils.image_store import get_image_store, detect_mimetype
+    
+    columns = {col['name'] for col in inspect(db.engine).get_columns('product')}
+    if 'image_bytes' not in columns:
+        print("No legacy image_bytes column, nothing to migrate")
+        return
+    
+    store = get_image_store()
+    last_id = 0
+    moved = 0
+    
+    while True:
+        # Keyset batches keep at most batch_size blobs in memory at once
+        rows = db.session.execute(text(
+            'SELECT id, image_bytes FROM product '
+            'WHERE image_bytes IS NOT NULL AND id > :last_id '
+            'ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+        if not rows:
+            break
+        
+        for product_id, data in rows:
+            data = bytes(data)
+            db.session.execute(text(
+                'UPDATE product SET image_digest = :digest, image_size = :size, '
+                'image_mime = :mime, image_bytes = NULL WHERE id = :id'
+            ), {
+                'digest': store.put(data),
+                'size': len(data),
+                'mime': detect_mimetype(data),
+                'id': product_id
+            })
+            last_id = product_id
+        
+        db.session.commit()
+        moved += len(rows)
+        print(f"Moved {moved} images (last product id {last_id})")
+    
+    print(f"Image migration complete: {moved} images moved")
+
+@app.cli.command("generate-image-variants")
+@click.option('--force', is_flag=True, help='Regenerate variants that already exist')
+def generate_image_variants_command(force):
+    """Build thumb/card/detail derivatives for stored product images"""
+    from app.utils.image_store import load_product_image
+    from app.utils.image_variants import save_product_variants
+    
+    query = Product.query.filter(Product.image_digest.isnot(None))
+    if not force:
+        query = query.filter(Product.image_variants.is_(None))
+    
+    count = 0
+    for product in query.order_by(Product.id).all():
+        data = load_product_image(product)
+        if data is None:
+            print(f"Missing blob for product {product.id}, skipped")
+            continue
+        save_product_variants(product, data)
+        db.session.commit()
+        count += 1
+    
+    print(f"Generated variants for {count} products")
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Rebuild the product full-text search index"""
+    from app.utils.search import rebuild_search_index, search_backend
+    
+    rebuild_search_index()
+    db.session.commit()
+    print(f"Search index rebuilt ({search_backend()} backend)")
+
+@app.cli.command("sweep-carts")
+@click.option('--max-age-days', type=int, default=None, help='Carts untouched this long are deleted (default CART_RETENTION_DAYS)')
+@click.option('--batch-size', type=int, default=None, help='Carts deleted per transaction (default CART_GC_BATCH_SIZE)')
+def sweep_carts_command(max_age_days, batch_size):
+    """Delete abandoned carts in bounded batches"""
+    from app.utils.cart_gc import sweep_stale_carts
+    
+    result = sweep_stale_carts(max_age_days=max_age_days, batch_size=batch_size)
+    print(f"Reclaimed {result['rows']} cart rows from {result['carts']} abandoned carts "
+          f"in {result['batches']} batches ({result['seconds']}s)")
+
+@app.cli.command("purge-sessions")
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction (default SESSION_PURGE_BATCH_SIZE)')
+def purge_sessions_command(batch_size):
+    """Delete expired rows from the server_session table"""
+    from app.utils.sessions import purge_expired_sessions
+    
+    deleted = purge_expired_sessions(batch_size or app.config['SESSION_PURGE_BATCH_SIZE'])
+    print(f"Purged {deleted} expired sessions")
+
+@app.cli.command("release-expired-holds")
+@click.option('--batch-size', type=int, default=None, help='Orders released per transaction (default STOCK_HOLD_BATCH_SIZE)')
+def release_expired_holds_command(batch_size):
+    """Release stock held by unpaid orders whose hold has run out"""
+    from app.utils.stock import release_expired_holds
+    
+    released = release_expired_holds(batch_size)
+    print(f"Released stock held by {released} expired orders")
+
+@app.cli.command("relay-checkout-outbox")
+@click.option('--batch-size', type=int, default=None, help='Outbox entries per transaction (default STOCK_HOLD_BATCH_SIZE)')
+def relay_checkout_outbox_command(batch_size):
+    """Resend unfinished checkouts to Stripe, expire what they left open and release their stock"""
+    from app.utils.checkout_outbox import relay_checkout_outbox
+    
+    settled = relay_checkout_outbox(batch_size)
+    print(f"Settled {settled} checkouts that never got a Stripe session back")
+
+@app.cli.command("purge-idempotency-keys")
+@click.option('--batch-size', type=int, default=1000, help='Rows deleted per transaction')
+def purge_idempotency_keys_command(batch_size):
+    """Delete expired place-order idempotency keys"""
+    from app.utils.idempotency import purge_expired_keys
+    
+    deleted = purge_expired_keys(batch_size)
+    print(f"Purged {deleted} expired idempotency keys")
+
+@app.cli.command("run-maintenance")
+def run_maintenance_command():
+    """Release expired holds, relay the checkout outbox and purge expired keys and sessions"""
+    from app.utils.maintenance import run_maintenance
+    
+    for name, result in run_maintenance().items():
+        print(f"{name}: {result}")
+
+@app.cli.command("process-stripe-events")
+@click.option('--batch-size', type=int, default=None, help='Events applied per transaction (default STRIPE_EVENT_BATCH_SIZE)')
+def process_stripe_events_command(batch_size):
+    """Apply queued Stripe webhook events to orders"""
+    from app.utils.stripe_events import process_stripe_events
+    
+    handled = process_stripe_events(batch_size)
+    print(f"Processed {handled} Stripe events")
+
 if __name__ == '__main__':
     app.run()
\ No newline at end of file
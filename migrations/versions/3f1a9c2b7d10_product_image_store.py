@@ -0,0 +1,41 @@
+"""Move product images to the image store
+
+Revision ID: 3f1a9c2b7d10
+Revises: 
+Create Date: 2026-10-17 09:12:44.318201
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a9c2b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables may already exist from db.create_all(), only add what is missing
+    columns = {col['name'] for col in sa.inspect(op.get_bind()).get_columns('product')}
+    
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        if 'image_digest' not in columns:
+            batch_op.add_column(sa.Column('image_digest', sa.String(length=64), nullable=True))
+            batch_op.create_index(batch_op.f('ix_product_image_digest'), ['image_digest'], unique=False)
+        if 'image_size' not in columns:
+            batch_op.add_column(sa.Column('image_size', sa.Integer(), nullable=True))
+        if 'image_mime' not in columns:
+            batch_op.add_column(sa.Column('image_mime', sa.String(length=50), nullable=True))
+    
+    # The legacy image_bytes column is kept until `flask migrate-images`
+    # has copied the blobs out; it is no longer mapped on the model.
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_product_image_digest'))
+        batch_op.drop_column('image_mime')
+        batch_op.drop_column('image_size')
+        batch_op.drop_column('image_digest')
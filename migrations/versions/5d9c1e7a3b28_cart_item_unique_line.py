@@ -0,0 +1,45 @@
+"""Make cart lines unique per (session_id, product_id)
+
+Revision ID: 5d9c1e7a3b28
+Revises: e2a8f4b61c95
+Create Date: 2026-10-17 15:05:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9c1e7a3b28'
+down_revision = 'e2a8f4b61c95'
+branch_labels = None
+depends_on = None
+
+
+INDEX_NAME = 'uq_cart_item_session_product'
+
+
+def upgrade():
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('cart_item')}
+    if INDEX_NAME in existing:
+        return
+    
+    # Fold duplicate lines into the oldest one before the index can be built
+    op.execute(
+        "UPDATE cart_item SET quantity = ("
+        "SELECT SUM(dup.quantity) FROM cart_item dup "
+        "WHERE dup.session_id = cart_item.session_id AND dup.product_id = cart_item.product_id"
+        ") WHERE id IN ("
+        "SELECT MIN(id) FROM cart_item GROUP BY session_id, product_id HAVING COUNT(*) > 1"
+        ")"
+    )
+    op.execute(
+        "DELETE FROM cart_item WHERE id NOT IN ("
+        "SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM cart_item GROUP BY session_id, product_id) AS keep"
+        ")"
+    )
+    op.create_index(INDEX_NAME, 'cart_item', ['session_id', 'product_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='cart_item')
@@ -0,0 +1,36 @@
+"""Add indexed cart_item.updated_at for abandoned cart cleanup
+
+Revision ID: 9a3f7c2e4d61
+Revises: 5d9c1e7a3b28
+Create Date: 2026-10-17 15:48:30.227914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3f7c2e4d61'
+down_revision = '5d9c1e7a3b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {col['name'] for col in inspector.get_columns('cart_item')}
+    
+    if 'updated_at' not in columns:
+        with op.batch_alter_table('cart_item', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute('UPDATE cart_item SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)')
+    
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('cart_item')}
+    if 'ix_cart_item_updated_at' not in indexes:
+        op.create_index('ix_cart_item_updated_at', 'cart_item', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_cart_item_updated_at', table_name='cart_item')
+    with op.batch_alter_table('cart_item', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
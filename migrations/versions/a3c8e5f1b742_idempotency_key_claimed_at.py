@@ -0,0 +1,34 @@
+"""Add idempotency_key.claimed_at for stale claim takeover
+
+Revision ID: a3c8e5f1b742
+Revises: d7f2a9c84e31
+Create Date: 2026-10-17 23:59:41.730265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c8e5f1b742'
+down_revision = 'd7f2a9c84e31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {col['name'] for col in inspector.get_columns('idempotency_key')}
+    if 'claimed_at' not in columns:
+        with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+        op.execute('UPDATE idempotency_key SET claimed_at = created_at')
+    indexes = {index['name'] for index in inspector.get_indexes('idempotency_key')}
+    if 'ix_idempotency_key_status_claimed' not in indexes:
+        op.create_index('ix_idempotency_key_status_claimed', 'idempotency_key', ['status', 'claimed_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_key_status_claimed', table_name='idempotency_key')
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.drop_column('claimed_at')
@@ -0,0 +1,42 @@
+"""Add checkout_outbox table
+
+Revision ID: a7c4e1f29b36
+Revises: f83c2a5d9e14
+Create Date: 2026-10-17 19:55:03.618204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c4e1f29b36'
+down_revision = 'f83c2a5d9e14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'checkout_outbox' in inspector.get_table_names():
+        return
+    
+    op.create_table('checkout_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('order_id')
+    )
+    op.create_index('ix_checkout_outbox_status_created', 'checkout_outbox', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_checkout_outbox_status_created', table_name='checkout_outbox')
+    op.drop_table('checkout_outbox')
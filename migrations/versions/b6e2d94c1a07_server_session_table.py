@@ -0,0 +1,34 @@
+"""Add server_session table for the SQL session backend
+
+Revision ID: b6e2d94c1a07
+Revises: 9a3f7c2e4d61
+Create Date: 2026-10-17 16:31:47.650193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2d94c1a07'
+down_revision = '9a3f7c2e4d61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'server_session' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    
+    op.create_table('server_session',
+        sa.Column('id', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('expiry', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_server_session_expiry', 'server_session', ['expiry'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_server_session_expiry', table_name='server_session')
+    op.drop_table('server_session')
@@ -0,0 +1,29 @@
+"""Add checkout_outbox.next_attempt_at for relay backoff
+
+Revision ID: b9d3e6f1a248
+Revises: e5b81d3c7a92
+Create Date: 2026-10-17 23:48:36.204519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d3e6f1a248'
+down_revision = 'e5b81d3c7a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {col['name'] for col in inspector.get_columns('checkout_outbox')}
+    if 'next_attempt_at' not in columns:
+        with op.batch_alter_table('checkout_outbox', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('checkout_outbox', schema=None) as batch_op:
+        batch_op.drop_column('next_attempt_at')
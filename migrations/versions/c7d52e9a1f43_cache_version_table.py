@@ -0,0 +1,32 @@
+"""Add cache_version table for cross-worker cache invalidation
+
+Revision ID: c7d52e9a1f43
+Revises: 8b4e61d0c2a7
+Create Date: 2026-10-17 11:26:05.102377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d52e9a1f43'
+down_revision = '8b4e61d0c2a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'cache_version' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    
+    op.create_table('cache_version',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
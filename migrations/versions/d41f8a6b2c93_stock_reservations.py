@@ -0,0 +1,56 @@
+"""Add stock_reservation holds and order.stock_deducted
+
+Revision ID: d41f8a6b2c93
+Revises: b6e2d94c1a07
+Create Date: 2026-10-17 17:12:08.931542
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f8a6b2c93'
+down_revision = 'b6e2d94c1a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    
+    order_columns = {col['name'] for col in inspector.get_columns('order')}
+    if 'stock_deducted' not in order_columns:
+        with op.batch_alter_table('order', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('stock_deducted', sa.Boolean(), nullable=False, server_default=sa.true()))
+        # Existing orders already took their items off stock when they were
+        # created, new ones start without a deduction
+        with op.batch_alter_table('order', schema=None) as batch_op:
+            batch_op.alter_column('stock_deducted', server_default=None)
+        op.execute('UPDATE "order" SET stock_deducted = false WHERE status = \'Cancelled\'')
+    
+    if 'stock_reservation' not in inspector.get_table_names():
+        op.create_table('stock_reservation',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('order_id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+            sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_stock_reservation_order_id', 'stock_reservation', ['order_id'], unique=False)
+        op.create_index('ix_stock_reservation_expires_at', 'stock_reservation', ['expires_at'], unique=False)
+        op.create_index('ix_stock_reservation_product_expires', 'stock_reservation',
+                        ['product_id', 'expires_at', 'quantity'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stock_reservation_product_expires', table_name='stock_reservation')
+    op.drop_index('ix_stock_reservation_expires_at', table_name='stock_reservation')
+    op.drop_index('ix_stock_reservation_order_id', table_name='stock_reservation')
+    op.drop_table('stock_reservation')
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_column('stock_deducted')
@@ -0,0 +1,80 @@
+"""Add the product full-text search index
+
+Revision ID: d7f2a9c84e31
+Revises: b9d3e6f1a248
+Create Date: 2026-10-17 23:56:02.517384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f2a9c84e31'
+down_revision = 'b9d3e6f1a248'
+branch_labels = None
+depends_on = None
+
+
+# Both backends keep the index in sync inside the database: triggers on
+# SQLite, a generated column on Postgres - so seed scripts and bulk
+# updates are indexed too, not just the product views
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+    "name, description, category, tokenize = 'porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts (rowid, name, description, category) "
+    "VALUES (new.id, new.name, coalesce(new.description, ''), coalesce(new.category, '')); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN "
+    "DELETE FROM product_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_update "
+    "AFTER UPDATE OF name, description, category ON product BEGIN "
+    "DELETE FROM product_fts WHERE rowid = old.id; "
+    "INSERT INTO product_fts (rowid, name, description, category) "
+    "VALUES (new.id, new.name, coalesce(new.description, ''), coalesce(new.category, '')); END",
+]
+
+SQLITE_BACKFILL = (
+    "INSERT INTO product_fts (rowid, name, description, category) "
+    "SELECT id, name, coalesce(description, ''), coalesce(category, '') FROM product"
+)
+
+POSTGRES_DDL = [
+    "ALTER TABLE product ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+    ") STORED",
+    "CREATE INDEX IF NOT EXISTS ix_product_search_vector ON product USING GIN (search_vector)",
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # Builds without FTS5 keep searching with LIKE
+        if not bind.execute(sa.text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+            return
+        exists = 'product_fts' in sa.inspect(bind).get_table_names()
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        if not exists:
+            op.execute(SQLITE_BACKFILL)
+    elif bind.dialect.name == 'postgresql':
+        # Generated columns need Postgres 12
+        if bind.dialect.server_version_info < (12,):
+            return
+        for statement in POSTGRES_DDL:
+            op.execute(statement)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for trigger in ('product_fts_update', 'product_fts_delete', 'product_fts_insert'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS product_fts')
+    elif bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_product_search_vector')
+        op.execute('ALTER TABLE product DROP COLUMN IF EXISTS search_vector')
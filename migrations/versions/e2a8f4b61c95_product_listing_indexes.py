@@ -0,0 +1,38 @@
+"""Add composite indexes for the product listing
+
+Revision ID: e2a8f4b61c95
+Revises: c7d52e9a1f43
+Create Date: 2026-10-17 12:40:51.774630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a8f4b61c95'
+down_revision = 'c7d52e9a1f43'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = {
+    'ix_product_listing_price': ['available', 'price', 'id'],
+    'ix_product_listing_name': ['available', 'name', 'id'],
+    'ix_product_listing_category_price': ['available', 'category', 'price', 'id'],
+    'ix_product_listing_size_price': ['available', 'size', 'price', 'id'],
+    'ix_product_available_stock': ['available', 'stock'],
+}
+
+
+def upgrade():
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('product')}
+    
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'product', columns, unique=False)
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='product')
@@ -0,0 +1,41 @@
+"""Add stripe_event webhook queue
+
+Revision ID: e5b81d3c7a92
+Revises: c2e9b7d40f58
+Create Date: 2026-10-17 22:31:14.082657
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b81d3c7a92'
+down_revision = 'c2e9b7d40f58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'stripe_event' in inspector.get_table_names():
+        return
+    
+    op.create_table('stripe_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_id', sa.String(length=255), nullable=False),
+        sa.Column('type', sa.String(length=100), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('event_id')
+    )
+    op.create_index('ix_stripe_event_pending', 'stripe_event', ['processed_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stripe_event_pending', table_name='stripe_event')
+    op.drop_table('stripe_event')